@@ -1,14 +1,9 @@
-import pyximport
-pyximport.install()
-import Cython.Compiler.Options
-Cython.Compiler.Options.annotate = True
-
 import logging
 import os
 
 from hyo2.abc2.lib.logging import set_logging
 from hyo2.abc2.lib.testing import Testing
-from hyo2.sdm4.lib.estimate.casttime.casttime import CastTime
+from hyo2.sdm4.lib.estimate.casttime import CastTime
 from hyo2.ssm2.lib.db.db import ProjectDb
 
 logger = logging.getLogger(__name__)
@@ -1,8 +1,3 @@
-import pyximport
-pyximport.install()
-import Cython.Compiler.Options
-Cython.Compiler.Options.annotate = True
-
 import logging
 logger = logging.getLogger()
 
@@ -35,7 +35,9 @@ class SurveyDataMonitor(AbstractWidget):
 
         self._plotting_active = False
         self._plotting_pause = False
-        self._last_nr_samples = 0
+        # latest plotted sample sequence number and generation (to only process the new samples)
+        self._last_seq = 0
+        self._last_generation = None
 
         # noinspection PyTypeChecker
         self._plotting_samples = int(self.settings.value("monitor/plotting_samples", 200))
@@ -231,8 +233,8 @@ class SurveyDataMonitor(AbstractWidget):
         # logger.debug("Plotting every %s milliseconds" % self._plotting_timing)
 
         # update text
-        self.monitor.lock_data()
         self.dw_info_viewer.info_viewer.setPlainText(self.monitor.data_info)
+        self.monitor.lock_data()
         self.dw_estimation_viewer.info_viewer.setPlainText(self.monitor.next_cast_info)
         self.dw_estimation_viewer.update_mode(self.monitor.mode)
         cur_time = datetime.now()
@@ -247,11 +249,10 @@ class SurveyDataMonitor(AbstractWidget):
         self.monitor.unlock_data()
 
         # update plots
-        cur_nr_samples = self.monitor.nr_of_samples()
-        if cur_nr_samples > self._last_nr_samples:
-            logger.debug("Plotting -> samples: %d" % cur_nr_samples)
-            self.update_plot_data(cur_nr_samples)
-        self._last_nr_samples = cur_nr_samples
+        snapshot = self.monitor.snapshot()
+        if (snapshot.last_seq != self._last_seq) or (snapshot.generation != self._last_generation):
+            logger.debug("Plotting -> samples: %d" % len(snapshot))
+            self.update_plot_data()
 
         # noinspection PyTypeChecker
         QtCore.QTimer.singleShot(self._plotting_timing, self.plotting)
@@ -301,53 +302,56 @@ class SurveyDataMonitor(AbstractWidget):
         self.settings.setValue("monitor/initial_area", area_label)
         self.update_plot_data()
 
-    def update_plot_data(self, nr_of_samples=None):
+    def update_plot_data(self):
 
-        if nr_of_samples is None:
-            nr_of_samples = self.monitor.nr_of_samples()
+        # the snapshot is immutable: no need to lock the monitor (and to block the ingest) while plotting
+        snapshot = self.monitor.snapshot()
+        nr_of_samples = len(snapshot)
 
         if nr_of_samples < 2:
             return
 
-        self.monitor.lock_data()
-
         # just plot the latest nth samples, if available
         plot_idx = self._plotting_samples
         if plot_idx > nr_of_samples:
             plot_idx = nr_of_samples
 
+        # only the samples added since the latest plotting are used to update the zoom range
+        delta = snapshot.samples_since(seq=self._last_seq, generation=self._last_generation)
+        self._last_seq = delta["seq"]
+        self._last_generation = delta["generation"]
+
         # logger.debug("plotting latest %d samples" % plot_idx)
-        times = self.monitor.times[-plot_idx:]
-        min_time = min(times) - timedelta(seconds=5)
-        max_time = max(times) + timedelta(seconds=5)
+        times = snapshot.column("time")[-plot_idx:]
+        min_time = times[0].item() - timedelta(seconds=5)
+        max_time = times[-1].item() + timedelta(seconds=5)
         cast_longs, cast_lats = self.monitor.lonlat_casts(min_time - timedelta(days=3650),
                                                           max_time + timedelta(days=3650))
         logger.debug("casts to visualize: %d" % len(cast_longs))
-        tsss = self.monitor.tsss[-plot_idx:]
-        min_tsss = min(tsss) - 0.3
-        max_tsss = max(tsss) + 0.3
+        tsss = snapshot.column("tss")[-plot_idx:]
+        min_tsss = tsss.min() - 0.3
+        max_tsss = tsss.max() + 0.3
 
         # find the tsss zoom range with new tsss samples
         try:
             min_zoom, max_zoom = self.dw_plot_tss.tss_ax.get_ylim()
-            nr_of_new_samples = nr_of_samples - self._last_nr_samples
-            if nr_of_new_samples > plot_idx:
-                nr_of_new_samples = plot_idx
-            new_tsss = self.monitor.tsss[-nr_of_new_samples:]
-            min_zoom = min(min_zoom, min(new_tsss) - 0.3)
-            max_zoom = max(max_zoom, max(new_tsss) + 0.3)
+            if delta["reset"]:
+                raise RuntimeError("cleared data")
+            new_tsss = delta["samples"]["tss"]
+            min_zoom = min(min_zoom, new_tsss.min() - 0.3)
+            max_zoom = max(max_zoom, new_tsss.max() + 0.3)
             min_tsss_zoom = max(min_zoom, min_tsss)
             max_tsss_zoom = min(max_zoom, max_tsss)
         except Exception:
             min_tsss_zoom = min_tsss
             max_tsss_zoom = max_tsss
 
-        drafts = self.monitor.drafts[-plot_idx:]
-        min_drafts = min(drafts) - 0.5
-        max_drafts = max(drafts) + 0.5
-        depths = self.monitor.depths[-plot_idx:]
-        min_depths = min(depths) - 5.
-        max_depths = max(depths) + 5.
+        drafts = snapshot.column("draft")[-plot_idx:]
+        min_drafts = drafts.min() - 0.5
+        max_drafts = drafts.max() + 0.5
+        depths = snapshot.column("avg_depth")[-plot_idx:]
+        min_depths = depths.min() - 5.
+        max_depths = depths.max() + 5.
         self.dw_plot_tss.tss.set_xdata(times)
         self.dw_plot_tss.tss.set_ydata(tsss)
         self.dw_plot_draft.draft.set_xdata(times)
@@ -355,8 +359,8 @@ class SurveyDataMonitor(AbstractWidget):
         self.dw_plot_depth.depth.set_xdata(times)
         self.dw_plot_depth.depth.set_ydata(depths)
 
-        longs = self.monitor.longs[-plot_idx:]
-        lats = self.monitor.lats[-plot_idx:]
+        longs = snapshot.column("long")[-plot_idx:]
+        lats = snapshot.column("lat")[-plot_idx:]
         self.dw_map.map_points.set_array(np.array(tsss))
         self.dw_map.map_points.set_offsets(np.vstack([longs, lats]).T)
         self.dw_map.map_points.set_clim(vmin=min_tsss, vmax=max_tsss)
@@ -378,8 +382,6 @@ class SurveyDataMonitor(AbstractWidget):
         self.dw_plot_draft.draft_ax.set_ylim(max_drafts, min_drafts)
         self.dw_plot_depth.depth_ax.set_ylim(max_depths, min_depths)
 
-        self.monitor.unlock_data()
-
         self.refresh_plots()
         # logger.debug("updated")
 
@@ -394,7 +396,8 @@ class SurveyDataMonitor(AbstractWidget):
 
         self._plotting_active = True
         self._plotting_pause = False
-        self._last_nr_samples = 0
+        self._last_seq = 0
+        self._last_generation = None
 
         logger.debug("Start plotting")
 
@@ -562,7 +565,7 @@ class SurveyDataMonitor(AbstractWidget):
             raise RuntimeError("Passed unsupported file extension: %s" % file_ext)
 
         nr_of_samples = self.monitor.nr_of_samples()
-        self.update_plot_data(nr_of_samples=nr_of_samples)
+        self.update_plot_data()
         if nr_of_samples > 2:
             self._make_tss_time_plot_visible(True)
             self._make_draft_time_plot_visible(True)
@@ -0,0 +1,337 @@
+import bisect
+import logging
+import os
+import sqlite3
+from collections import OrderedDict
+from pathlib import Path
+from threading import Lock
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class CastTracker:
+    """Track the casts in the current SSM project without listing them at each monitoring step
+
+    A cheap change token is checked at each refresh: the list of the casts is retrieved from the SSM library
+    only when the token changes. The token combines the SQLite data version (read on a kept read-only connection,
+    it changes on every commit by another connection) with the stat of the project db file and of its WAL
+    (catching a replaced file). When the token is not available (e.g., the project db is not on disk),
+    the list is retrieved at each refresh.
+    """
+
+    def __init__(self, ssm) -> None:
+        self._ssm = ssm
+
+        # read-only connection used for the data version of the project db (shared by the caller threads)
+        self._version_lock = Lock()
+        self._version_conn = None  # type: Optional[sqlite3.Connection]
+        self._version_file = None  # the (path, inode) of the connected db
+
+        self._db_path = None
+        self._token = None
+        self._rows = list()  # chronological list of (cast datetime, pk)
+        self._last_time = None
+        self._last_pk = None
+
+        self._checks = 0
+        self._refreshes = 0
+
+    def reset(self) -> None:
+        self._token = None
+        self._rows = list()
+        self._last_time = None
+        self._last_pk = None
+
+    @property
+    def db_path(self) -> Optional[str]:
+        projects_folder = getattr(self._ssm, "projects_folder", None)
+        project = getattr(self._ssm, "current_project", None)
+        if (not projects_folder) or (not project):
+            return None
+        return os.path.join(projects_folder, project + ".db")
+
+    def change_token(self) -> Optional[tuple]:
+        """Return a token that changes when the project db is modified (None if not available)"""
+        db_path = self.db_path
+        if db_path is None:
+            return None
+
+        try:
+            db_stat = os.stat(db_path)
+        except OSError:
+            return None
+
+        token = [db_path, db_stat.st_mtime_ns, db_stat.st_size]
+        try:
+            wal_stat = os.stat(db_path + "-wal")
+            token.extend([wal_stat.st_mtime_ns, wal_stat.st_size])
+        except OSError:
+            pass
+        token.append(self._data_version(db_path, db_stat.st_ino))
+        return tuple(token)
+
+    def _data_version(self, db_path: str, inode: int) -> Optional[int]:
+        with self._version_lock:
+            # a replaced db file requires a new connection
+            if (db_path, inode) != self._version_file:
+                self._close_version_conn()
+                try:
+                    self._version_conn = sqlite3.connect(Path(db_path).as_uri() + "?mode=ro", uri=True,
+                                                         check_same_thread=False)
+                except sqlite3.Error as e:
+                    logger.debug("unable to open %s: %s" % (db_path, e))
+                    return None
+                self._version_file = (db_path, inode)
+
+            try:
+                # noinspection SqlNoDataSourceInspection
+                return self._version_conn.execute("PRAGMA data_version").fetchone()[0]
+
+            except sqlite3.Error as e:
+                # only the file stat is used (e.g., not a SQLite db)
+                logger.debug("unable to read the data version of %s: %s" % (db_path, e))
+                return None
+
+    def _close_version_conn(self) -> None:
+        if self._version_conn is not None:
+            self._version_conn.close()
+        self._version_conn = None
+        self._version_file = None
+
+    def close(self) -> None:
+        """Release the connection to the project db (reopened when needed)"""
+        with self._version_lock:
+            self._close_version_conn()
+
+    def refresh(self) -> list:
+        """Return the casts newer than the latest known one (an empty list if the project db is unchanged)"""
+        self._checks += 1
+        token = self.change_token()
+        if (token is not None) and (token == self._token):
+            return list()
+
+        db_path = self.db_path
+        if db_path != self._db_path:
+            logger.debug("project db: %s" % db_path)
+            self.reset()
+            self._db_path = db_path
+
+        rows = sorted(self._ssm.db_timestamp_list(), key=lambda row: row[0])
+        self._refreshes += 1
+        self._token = token
+
+        if self._last_time is None:
+            new_rows = rows
+        else:
+            new_rows = [row for row in rows if row[0] > self._last_time]
+        self._rows = rows
+        if len(rows) > 0:
+            self._last_time = rows[-1][0]
+            self._last_pk = rows[-1][1]
+        return new_rows
+
+    @property
+    def rows(self) -> list:
+        """The (cast datetime, pk) of the known casts, in chronological order (do not modify)"""
+        return self._rows
+
+    @property
+    def nr_casts(self) -> int:
+        return len(self._rows)
+
+    @property
+    def last_time(self):
+        return self._last_time
+
+    @property
+    def last_pk(self) -> Optional[int]:
+        return self._last_pk
+
+    @property
+    def stats(self) -> dict:
+        return {
+            "checks": self._checks,
+            "refreshes": self._refreshes,
+            "casts": len(self._rows),
+        }
+
+    def __repr__(self) -> str:
+        msg = "<%s>\n" % self.__class__.__name__
+        msg += "  <db path: %s>\n" % self.db_path
+        msg += "  <casts: %d>\n" % len(self._rows)
+        msg += "  <refreshes: %d/%d>\n" % (self._refreshes, self._checks)
+        return msg
+
+
+class ProfileCache:
+    """Bounded LRU cache of the SSM profiles, keyed by pk
+
+    The cache is invalidated when the change token of the project db differs from the one of the cached
+    profiles. When the token is not available, the profiles are not cached.
+    """
+
+    def __init__(self, ssm, tracker: CastTracker, max_size: Optional[int] = 64) -> None:
+        if max_size < 1:
+            raise RuntimeError("invalid max size: %s" % max_size)
+        self._ssm = ssm
+        self._tracker = tracker
+        self._max_size = max_size
+
+        self._lock = Lock()
+        self._profiles = OrderedDict()
+        self._token = None
+
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._invalidations = 0
+
+    @property
+    def max_size(self) -> int:
+        return self._max_size
+
+    def clear(self) -> None:
+        with self._lock:
+            self._profiles.clear()
+            self._token = None
+
+    def retrieve(self, pk: int):
+        """Return the profile with the passed pk (retrieving it from the SSM library on a miss)"""
+        token = self._tracker.change_token()
+        with self._lock:
+            if token != self._token:
+                if len(self._profiles) > 0:
+                    self._invalidations += 1
+                self._profiles.clear()
+                self._token = token
+
+            if (token is not None) and (pk in self._profiles):
+                self._profiles.move_to_end(pk)
+                self._hits += 1
+                return self._profiles[pk]
+            self._misses += 1
+
+        profile = self._ssm.db_retrieve_profile(pk)
+        if (token is None) or (profile is None):
+            return profile
+
+        with self._lock:
+            if token != self._token:
+                return profile
+            self._profiles[pk] = profile
+            self._profiles.move_to_end(pk)
+            while len(self._profiles) > self._max_size:
+                self._profiles.popitem(last=False)
+                self._evictions += 1
+        return profile
+
+    def __len__(self) -> int:
+        return len(self._profiles)
+
+    @property
+    def stats(self) -> dict:
+        return {
+            "size": len(self._profiles),
+            "hits": self._hits,
+            "misses": self._misses,
+            "evictions": self._evictions,
+            "invalidations": self._invalidations,
+        }
+
+    def __repr__(self) -> str:
+        msg = "<%s>\n" % self.__class__.__name__
+        msg += "  <profiles: %d/%d>\n" % (len(self._profiles), self._max_size)
+        msg += "  <hits: %d, misses: %d>\n" % (self._hits, self._misses)
+        return msg
+
+
+class CastIndex:
+    """In-memory index of the cast positions, queried by binary search on the cast time
+
+    The index has its own tracker: when the casts change, only the profiles of the new casts are retrieved
+    (the known casts are matched by pk and time).
+    """
+
+    def __init__(self, ssm) -> None:
+        self._ssm = ssm
+        self._tracker = CastTracker(ssm=ssm)
+
+        self._lock = Lock()
+        self._rows = None
+        self._positions = dict()  # (pk, cast datetime) -> (longitude, latitude)
+        self._times = list()
+        self._lons = list()
+        self._lats = list()
+
+        self._loaded = 0
+
+    def clear(self) -> None:
+        with self._lock:
+            self._tracker.reset()
+            self._rows = None
+            self._positions = dict()
+            self._times = list()
+            self._lons = list()
+            self._lats = list()
+
+    def close(self) -> None:
+        """Release the connection of the tracker to the project db (reopened when needed)"""
+        self._tracker.close()
+
+    def _refresh(self) -> None:
+        self._tracker.refresh()
+        rows = self._tracker.rows
+        # the tracker replaces its list of rows only when the casts are listed again
+        if rows is self._rows:
+            return
+
+        positions = dict()
+        times = list()
+        lons = list()
+        lats = list()
+        for cast_time, pk in rows:
+            key = (pk, cast_time)
+            position = self._positions.get(key)
+            if position is None:
+                ssp = self._ssm.db_retrieve_profile(pk)
+                self._loaded += 1
+                if ssp is None:
+                    logger.warning("unable to retrieve cast #%d" % pk)
+                    continue
+                position = (ssp.cur.meta.longitude, ssp.cur.meta.latitude)
+            positions[key] = position
+            times.append(cast_time)
+            lons.append(position[0])
+            lats.append(position[1])
+
+        self._rows = rows
+        self._positions = positions
+        self._times = times
+        self._lons = lons
+        self._lats = lats
+        logger.debug("indexed casts: %d (loaded profiles: %d)" % (len(times), self._loaded))
+
+    def lonlat_between(self, min_time, max_time) -> tuple:
+        """Return the longitudes and the latitudes of the casts in the [min_time, max_time] time range"""
+        with self._lock:
+            self._refresh()
+            idx0 = bisect.bisect_left(self._times, min_time)
+            idx1 = bisect.bisect_right(self._times, max_time)
+            return self._lons[idx0:idx1], self._lats[idx0:idx1]
+
+    def __len__(self) -> int:
+        return len(self._times)
+
+    @property
+    def stats(self) -> dict:
+        return {
+            "casts": len(self._times),
+            "loaded": self._loaded,
+        }
+
+    def __repr__(self) -> str:
+        msg = "<%s>\n" % self.__class__.__name__
+        msg += "  <casts: %d>\n" % len(self._times)
+        msg += "  <loaded profiles: %d>\n" % self._loaded
+        return msg
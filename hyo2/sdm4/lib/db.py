@@ -1,14 +1,14 @@
 import logging
 import os
 import sqlite3
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 
 import numpy as np
 
 from hyo2.sdm4 import __version__ as version
 from hyo2.sdm4 import name as name
 from hyo2.sdm4.lib.export import ExportDb
-from hyo2.ssm2.lib.db.point import Point, convert_point, adapt_point
+from hyo2.ssm2.lib.db.point import Point
 
 logger = logging.getLogger(__name__)
 
@@ -16,7 +16,22 @@ logger = logging.getLogger(__name__)
 class MonitorDb:
     """Class that provides an interface to a SQLite db with Survey Monitor data"""
 
-    def __init__(self, projects_folder=None, base_name=None):
+    # current version of the db schema (stored in the library table)
+    # - v1: time as 'timestamp', position as ssm2 'point'
+    # - v2: time as integer microseconds since the UTC epoch, separate real long/lat columns
+    schema_version = 2
+
+    # columns that can be retrieved as NumPy arrays
+    point_columns = ("time", "long", "lat", "tss", "draft", "avg_depth")
+
+    # time-bucket summary tables (name: bucket size in seconds), incrementally maintained by triggers
+    summary_resolutions = {"minute": 60, "hour": 3600}
+    summary_values = ("tss", "draft", "avg_depth")
+
+    epoch = datetime(1970, 1, 1)
+
+    def __init__(self, projects_folder=None, base_name=None, wal_mode=False, check_same_thread=True,
+                 spatial_index=True):
 
         # in case that no data folder is passed
         if projects_folder is None:
@@ -37,6 +52,14 @@ class MonitorDb:
 
         # add variable used to store the connection to the database
         self.conn = None
+        # WAL journaling is meant for long-lived writer connections (e.g., a monitoring session)
+        self.wal_mode = wal_mode
+        self.check_same_thread = check_same_thread
+        # R*Tree index on the positions (only if supported by the SQLite build)
+        self.spatial_index = spatial_index
+        self.has_spatial_index = False
+        # False for a db with duplicated times (see remove_duplicated_times)
+        self.has_unique_time = False
 
         self.tmp_data = None
         self.tmp_id = None
@@ -61,7 +84,8 @@ class MonitorDb:
 
         try:
             self.conn = sqlite3.connect(self.db_path,
-                                        detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES)
+                                        detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES,
+                                        check_same_thread=self.check_same_thread)
             # logger.info("Connected")
 
         except sqlite3.Error as e:
@@ -75,16 +99,20 @@ class MonitorDb:
         except sqlite3.Error as e:
             raise RuntimeError("Unable to activate foreign keys: %s" % e)
 
-        try:
-            # Set the row factory
-            self.conn.row_factory = sqlite3.Row
-            # Register the adapter
-            sqlite3.register_adapter(Point, adapt_point)
-            # Register the converter
-            sqlite3.register_converter("point", convert_point)
+        if self.wal_mode:
+            try:
+                # noinspection SqlNoDataSourceInspection
+                mode = self.conn.execute('PRAGMA journal_mode=WAL').fetchone()[0]
+                if mode.lower() != "wal":
+                    logger.warning("unable to set WAL journal mode: %s" % mode)
+                # in WAL mode, NORMAL is safe from corruption and only syncs at checkpoints
+                self.conn.execute('PRAGMA synchronous=NORMAL')
 
-        except sqlite3.Error as e:
-            raise RuntimeError("Unable to register 'point': %s - %s" % (type(e), e))
+            except sqlite3.Error as e:
+                raise RuntimeError("Unable to set WAL journaling: %s" % e)
+
+        # Set the row factory
+        self.conn.row_factory = sqlite3.Row
 
         try:
             # Register the adapter
@@ -107,6 +135,7 @@ class MonitorDb:
 
         try:
             self.conn.close()
+            self.conn = None
             # logger.info("Disconnected")
             return True
 
@@ -145,25 +174,383 @@ class MonitorDb:
                     self.conn.execute("""
                                       INSERT INTO library VALUES (?, ?, ?)
                                       """,
-                                      (1, "%s v.%s" % (name, version), datetime.now(tz=timezone.utc),))
+                                      (self.schema_version, "%s v.%s" % (name, version),
+                                       datetime.now(tz=timezone.utc),))
+
+            upgraded = False
+            db_version = self.get_db_version()
+            if db_version == 1:
+                if not self._upgrade_from_v1():
+                    # e.g., read-only file: the v1 data are still made readable
+                    return self._create_v1_view()
+                upgraded = True
+
+            elif db_version != self.schema_version:
+                logger.error("unsupported db version: %s" % db_version)
+                return False
+
+            with self.conn:
                 # noinspection SqlNoDataSourceInspection
                 self.conn.execute("""
                                   CREATE TABLE IF NOT EXISTS data(
                                       id INTEGER PRIMARY KEY,
-                                      time timestamp NOT NULL,
-                                      position point NOT NULL,
-                                      tss real NOT NULL,
-                                      draft real NOT NULL,
-                                      avg_depth real NOT NULL
+                                      time INTEGER NOT NULL,
+                                      long REAL NOT NULL,
+                                      lat REAL NOT NULL,
+                                      tss REAL NOT NULL,
+                                      draft REAL NOT NULL,
+                                      avg_depth REAL NOT NULL
                                      )
                                   """)
 
-            return True
+            if not self._build_unique_time_index():
+                return False
+
+            # the v1 sessions could store samples with the same time: the upgrade removes them
+            if upgraded and not self.has_unique_time:
+                logger.info("removing the duplicated times of the upgraded db")
+                if self.remove_duplicated_times() is None:
+                    return False
+
+            if self.spatial_index:
+                self.has_spatial_index = self._build_spatial_index()
+
+            return self._build_summary_tables()
 
         except sqlite3.Error as e:
             logger.error("during building tables, %s: %s" % (type(e), e))
             return False
 
+    def _build_unique_time_index(self):
+        """Make the time a unique key, so that duplicated samples are rejected by SQLite
+
+        The stored samples are never removed here: with duplicated times, the time index is left non-unique
+        (and the insertions check for an existing time).
+        """
+        # noinspection SqlNoDataSourceInspection
+        ret = self.conn.execute("""
+                                SELECT COUNT(*) FROM sqlite_master WHERE type='index' AND name='data_time_uidx'
+                                """).fetchone()
+        if ret[0] == 1:
+            self.has_unique_time = True
+            return True
+
+        try:
+            # noinspection SqlNoDataSourceInspection
+            nr_duplicated = self.conn.execute("""SELECT COUNT(*) - COUNT(DISTINCT time) FROM data""").fetchone()[0]
+            with self.conn:
+                if nr_duplicated > 0:
+                    logger.warning("%d samples with duplicated time in %s -> time index left non-unique "
+                                   "(see remove_duplicated_times)" % (nr_duplicated, self.db_path))
+                    # noinspection SqlNoDataSourceInspection
+                    self.conn.execute("""CREATE INDEX IF NOT EXISTS data_time_idx ON data(time)""")
+                    self.has_unique_time = False
+                    return True
+
+                # noinspection SqlNoDataSourceInspection
+                self.conn.execute("""DROP INDEX IF EXISTS data_time_idx""")
+                # noinspection SqlNoDataSourceInspection
+                self.conn.execute("""CREATE UNIQUE INDEX data_time_uidx ON data(time)""")
+
+            self.has_unique_time = True
+            return True
+
+        except sqlite3.Error as e:
+            logger.error("during building time index, %s: %s" % (type(e), e))
+            return False
+
+    def remove_duplicated_times(self):
+        """Migration step removing the samples with a duplicated time, then making the time a unique key
+
+        For each duplicated time, the first stored sample is kept. Return the number of removed samples,
+        or None in case of failure.
+        """
+        if not self.conn:
+            logger.error("missing db connection")
+            return None
+
+        try:
+            with self.conn:
+                # noinspection SqlNoDataSourceInspection
+                ret = self.conn.execute("""
+                                        DELETE FROM data WHERE id NOT IN (SELECT MIN(id) FROM data GROUP BY time)
+                                        """)
+                nr_removed = max(ret.rowcount, 0)
+                # noinspection SqlNoDataSourceInspection
+                self.conn.execute("""DROP INDEX IF EXISTS data_time_idx""")
+                # noinspection SqlNoDataSourceInspection
+                self.conn.execute("""CREATE UNIQUE INDEX IF NOT EXISTS data_time_uidx ON data(time)""")
+
+        except sqlite3.Error as e:
+            logger.error("while removing duplicated times, %s: %s" % (type(e), e))
+            return None
+
+        self.has_unique_time = True
+        logger.info("removed %d samples with duplicated time from %s" % (nr_removed, self.db_path))
+        return nr_removed
+
+    def _build_spatial_index(self):
+        """Create (or rebuild, if not in sync) the optional R*Tree index on the point positions"""
+        # noinspection SqlNoDataSourceInspection
+        nr_triggers = self.conn.execute("""
+                                        SELECT COUNT(*) FROM sqlite_master
+                                        WHERE type='trigger' AND name LIKE 'data_rtree_%'
+                                        """).fetchone()[0]
+
+        try:
+            with self.conn:
+                # noinspection SqlNoDataSourceInspection
+                self.conn.execute("""
+                                  CREATE VIRTUAL TABLE IF NOT EXISTS data_rtree
+                                  USING rtree(id, min_long, max_long, min_lat, max_lat)
+                                  """)
+                # noinspection SqlNoDataSourceInspection
+                self.conn.execute("""
+                                  CREATE TRIGGER IF NOT EXISTS data_rtree_insert AFTER INSERT ON data
+                                  BEGIN
+                                      INSERT INTO data_rtree VALUES (NEW.id, NEW.long, NEW.long, NEW.lat, NEW.lat);
+                                  END
+                                  """)
+                # noinspection SqlNoDataSourceInspection
+                self.conn.execute("""
+                                  CREATE TRIGGER IF NOT EXISTS data_rtree_update AFTER UPDATE OF long, lat ON data
+                                  BEGIN
+                                      UPDATE data_rtree SET min_long=NEW.long, max_long=NEW.long,
+                                                            min_lat=NEW.lat, max_lat=NEW.lat
+                                      WHERE id=NEW.id;
+                                  END
+                                  """)
+                # noinspection SqlNoDataSourceInspection
+                self.conn.execute("""
+                                  CREATE TRIGGER IF NOT EXISTS data_rtree_delete AFTER DELETE ON data
+                                  BEGIN
+                                      DELETE FROM data_rtree WHERE id=OLD.id;
+                                  END
+                                  """)
+
+                # missing triggers: the index is new or it was not kept in sync
+                if nr_triggers < 3:
+                    logger.debug("building spatial index")
+                    # noinspection SqlNoDataSourceInspection
+                    self.conn.execute("""DELETE FROM data_rtree""")
+                    # noinspection SqlNoDataSourceInspection
+                    self.conn.execute("""
+                                      INSERT INTO data_rtree SELECT id, long, long, lat, lat FROM data
+                                      """)
+
+            return True
+
+        except sqlite3.Error as e:
+            logger.warning("unable to build the spatial index, %s: %s" % (type(e), e))
+            self._drop_spatial_index_triggers()
+            return False
+
+    def _drop_spatial_index_triggers(self):
+        # without the triggers, a db with an R*Tree can still be written by a SQLite build without R*Tree support
+        try:
+            with self.conn:
+                for trigger in ("data_rtree_insert", "data_rtree_update", "data_rtree_delete"):
+                    # noinspection SqlNoDataSourceInspection
+                    self.conn.execute("""DROP TRIGGER IF EXISTS %s""" % trigger)
+
+        except sqlite3.Error as e:
+            logger.warning("unable to drop the spatial index triggers, %s: %s" % (type(e), e))
+
+    def _build_summary_tables(self):
+        """Create (or rebuild, if not in sync) the time-bucket summary tables"""
+        for resolution, bucket_size in self.summary_resolutions.items():
+            table = "summary_%s" % resolution
+            bucket_us = bucket_size * 1000000
+
+            # noinspection SqlNoDataSourceInspection
+            nr_triggers = self.conn.execute("""
+                                            SELECT COUNT(*) FROM sqlite_master WHERE type='trigger' AND name LIKE ?
+                                            """, (table + "_%",)).fetchone()[0]
+
+            value_fields = list()
+            inserted_values = list()
+            upserted_values = list()
+            aggregated_values = list()
+            for value in self.summary_values:
+                value_fields.append("%s_min REAL NOT NULL, %s_max REAL NOT NULL, %s_sum REAL NOT NULL"
+                                    % (value, value, value))
+                inserted_values.append("NEW.%s, NEW.%s, NEW.%s" % (value, value, value))
+                upserted_values.append("%s_min=MIN(%s_min, excluded.%s_min), %s_max=MAX(%s_max, excluded.%s_max), "
+                                       "%s_sum=%s_sum + excluded.%s_sum" % ((value, ) * 9))
+                aggregated_values.append("MIN(%s), MAX(%s), SUM(%s)" % (value, value, value))
+
+            # recompute a bucket from the data table (min and max cannot be decremented)
+            recompute = """
+                        DELETE FROM {table} WHERE bucket={row}.time / {bucket_us};
+                        INSERT INTO {table}
+                        SELECT time / {bucket_us}, COUNT(*), {aggregated},
+                               MIN(long), MAX(long), MIN(lat), MAX(lat)
+                        FROM data
+                        WHERE time >= ({row}.time / {bucket_us}) * {bucket_us}
+                          AND time < ({row}.time / {bucket_us} + 1) * {bucket_us}
+                        GROUP BY time / {bucket_us};
+                        """
+            try:
+                with self.conn:
+                    # noinspection SqlNoDataSourceInspection
+                    self.conn.execute("""
+                                      CREATE TABLE IF NOT EXISTS %s(
+                                          bucket INTEGER PRIMARY KEY,
+                                          count INTEGER NOT NULL,
+                                          %s,
+                                          min_long REAL NOT NULL,
+                                          max_long REAL NOT NULL,
+                                          min_lat REAL NOT NULL,
+                                          max_lat REAL NOT NULL
+                                         )
+                                      """ % (table, ", ".join(value_fields)))
+                    # noinspection SqlNoDataSourceInspection
+                    self.conn.execute("""
+                                      CREATE TRIGGER IF NOT EXISTS {table}_insert AFTER INSERT ON data
+                                      BEGIN
+                                          INSERT INTO {table} VALUES (NEW.time / {bucket_us}, 1, {inserted},
+                                                                      NEW.long, NEW.long, NEW.lat, NEW.lat)
+                                          ON CONFLICT(bucket) DO UPDATE SET
+                                              count=count + 1, {upserted},
+                                              min_long=MIN(min_long, excluded.min_long),
+                                              max_long=MAX(max_long, excluded.max_long),
+                                              min_lat=MIN(min_lat, excluded.min_lat),
+                                              max_lat=MAX(max_lat, excluded.max_lat);
+                                      END
+                                      """.format(table=table, bucket_us=bucket_us,
+                                                 inserted=", ".join(inserted_values),
+                                                 upserted=", ".join(upserted_values)))
+                    # noinspection SqlNoDataSourceInspection
+                    self.conn.execute("""
+                                      CREATE TRIGGER IF NOT EXISTS {table}_delete AFTER DELETE ON data
+                                      BEGIN
+                                          {recompute_old}
+                                      END
+                                      """.format(table=table,
+                                                 recompute_old=recompute.format(table=table, row="OLD",
+                                                                                bucket_us=bucket_us,
+                                                                                aggregated=", ".join(
+                                                                                    aggregated_values))))
+                    # noinspection SqlNoDataSourceInspection
+                    self.conn.execute("""
+                                      CREATE TRIGGER IF NOT EXISTS {table}_update AFTER UPDATE ON data
+                                      BEGIN
+                                          {recompute_old}
+                                          {recompute_new}
+                                      END
+                                      """.format(table=table,
+                                                 recompute_old=recompute.format(table=table, row="OLD",
+                                                                                bucket_us=bucket_us,
+                                                                                aggregated=", ".join(
+                                                                                    aggregated_values)),
+                                                 recompute_new=recompute.format(table=table, row="NEW",
+                                                                                bucket_us=bucket_us,
+                                                                                aggregated=", ".join(
+                                                                                    aggregated_values))))
+
+                    # missing triggers: the table is new or it was not kept in sync
+                    if nr_triggers < 3:
+                        logger.debug("building %s summary table" % resolution)
+                        # noinspection SqlNoDataSourceInspection
+                        self.conn.execute("""DELETE FROM %s""" % table)
+                        # noinspection SqlNoDataSourceInspection
+                        self.conn.execute("""
+                                          INSERT INTO {table}
+                                          SELECT time / {bucket_us}, COUNT(*), {aggregated},
+                                                 MIN(long), MAX(long), MIN(lat), MAX(lat)
+                                          FROM data GROUP BY time / {bucket_us}
+                                          """.format(table=table, bucket_us=bucket_us,
+                                                     aggregated=", ".join(aggregated_values)))
+
+            except sqlite3.Error as e:
+                logger.error("during building %s summary table, %s: %s" % (resolution, type(e), e))
+                return False
+
+        return True
+
+    # --- schema upgrade
+
+    @classmethod
+    def _v1_time_to_us(cls, value):
+        if isinstance(value, bytes):
+            value = value.decode()
+        return cls.timestamp_to_us(datetime.fromisoformat(value))
+
+    @classmethod
+    def _v1_position_to_long(cls, value):
+        if isinstance(value, bytes):
+            value = value.decode()
+        return float(value.split(";")[0])
+
+    @classmethod
+    def _v1_position_to_lat(cls, value):
+        if isinstance(value, bytes):
+            value = value.decode()
+        return float(value.split(";")[1])
+
+    def _register_v1_functions(self):
+        self.conn.create_function("v1_time_to_us", 1, self._v1_time_to_us, deterministic=True)
+        self.conn.create_function("v1_position_to_long", 1, self._v1_position_to_long, deterministic=True)
+        self.conn.create_function("v1_position_to_lat", 1, self._v1_position_to_lat, deterministic=True)
+
+    def _upgrade_from_v1(self):
+        """Migrate in place the data table from the v1 schema to the current one"""
+        logger.info("upgrading monitor db from v1 to v%d: %s" % (self.schema_version, self.db_path))
+        self._register_v1_functions()
+
+        try:
+            with self.conn:
+                # noinspection SqlNoDataSourceInspection
+                self.conn.execute("""
+                                  CREATE TABLE data_v2(
+                                      id INTEGER PRIMARY KEY,
+                                      time INTEGER NOT NULL,
+                                      long REAL NOT NULL,
+                                      lat REAL NOT NULL,
+                                      tss REAL NOT NULL,
+                                      draft REAL NOT NULL,
+                                      avg_depth REAL NOT NULL
+                                     )
+                                  """)
+                # noinspection SqlNoDataSourceInspection
+                self.conn.execute("""
+                                  INSERT INTO data_v2
+                                  SELECT id, v1_time_to_us(time), v1_position_to_long(position),
+                                         v1_position_to_lat(position), tss, draft, avg_depth
+                                  FROM data
+                                  """)
+                # noinspection SqlNoDataSourceInspection
+                self.conn.execute("""DROP TABLE data""")
+                # noinspection SqlNoDataSourceInspection
+                self.conn.execute("""ALTER TABLE data_v2 RENAME TO data""")
+                # noinspection SqlNoDataSourceInspection
+                self.conn.execute("""UPDATE library SET version=?""", (self.schema_version,))
+
+            return True
+
+        except (sqlite3.Error, ValueError) as e:
+            logger.warning("unable to upgrade the monitor db, %s: %s" % (type(e), e))
+            return False
+
+    def _create_v1_view(self):
+        """Expose a v1 data table (that cannot be upgraded) with the current schema layout"""
+        try:
+            with self.conn:
+                # a temporary view takes precedence over the 'data' table for unqualified names
+                # noinspection SqlNoDataSourceInspection
+                self.conn.execute("""
+                                  CREATE TEMP VIEW IF NOT EXISTS data AS
+                                  SELECT id, v1_time_to_us(time) AS time, v1_position_to_long(position) AS long,
+                                         v1_position_to_lat(position) AS lat, tss, draft, avg_depth
+                                  FROM main.data
+                                  """)
+            logger.info("monitor db accessed through a read-only v1 view")
+            return True
+
+        except sqlite3.Error as e:
+            logger.error("during creating v1 view, %s: %s" % (type(e), e))
+            return False
+
     def add_point(self, timestamp, long, lat, tss, draft, avg_depth):
 
         if not isinstance(timestamp, datetime):
@@ -200,6 +587,188 @@ class MonitorDb:
             logger.error("during adding casts, %s: %s" % (type(e), e))
             return False
 
+    def add_points(self, timestamps, longs, lats, tsss, drafts, avg_depths):
+        """Add a batch of points, passed as columns, using a single transaction
+
+        The timestamps can be either a sequence of datetime or a NumPy datetime64 array.
+        The points with a time already present in the db are skipped.
+        Return the numbers of inserted and skipped points, or None in case of failure.
+        """
+
+        nr_points = len(timestamps)
+        for label, column in (("longitude", longs), ("latitude", lats), ("tss", tsss),
+                              ("draft", drafts), ("avg depth", avg_depths)):
+            if len(column) != nr_points:
+                raise RuntimeError("not passed a valid number of %s values: %d (expected: %d)"
+                                   % (label, len(column), nr_points))
+        if nr_points == 0:
+            return 0, 0
+
+        if isinstance(timestamps, np.ndarray) and (timestamps.dtype.kind == "M"):
+            times = timestamps.astype("datetime64[us]").astype(np.int64)
+        else:
+            for timestamp in timestamps:
+                if not isinstance(timestamp, datetime):
+                    raise RuntimeError("not passed a valid timestamp: %s" % type(timestamp))
+            times = np.fromiter((self.timestamp_to_us(timestamp) for timestamp in timestamps),
+                                dtype=np.int64, count=nr_points)
+
+        try:
+            longs = np.asarray(longs, dtype=np.float64)
+            lats = np.asarray(lats, dtype=np.float64)
+            tsss = np.asarray(tsss, dtype=np.float64)
+            drafts = np.asarray(drafts, dtype=np.float64)
+            avg_depths = np.asarray(avg_depths, dtype=np.float64)
+        except (TypeError, ValueError) as e:
+            raise RuntimeError("not passed valid numerical values: %s" % e)
+
+        invalid = np.flatnonzero((longs > 180.0) | (longs < -180.0))
+        if invalid.size > 0:
+            raise RuntimeError("not passed a valid longitude: %s" % longs[invalid[0]])
+        invalid = np.flatnonzero((lats > 90.0) | (lats < -90.0))
+        if invalid.size > 0:
+            raise RuntimeError("not passed a valid latitude: %s" % lats[invalid[0]])
+
+        if not self.conn:
+            logger.error("missing db connection")
+            return None
+
+        rows = zip(times.tolist(), longs.tolist(), lats.tolist(), tsss.tolist(), drafts.tolist(),
+                   avg_depths.tolist())
+
+        try:
+            with self.conn:
+                if self.has_unique_time:
+                    # noinspection SqlNoDataSourceInspection
+                    ret = self.conn.executemany("""
+                                                INSERT OR IGNORE INTO data (time, long, lat, tss, draft, avg_depth)
+                                                VALUES (?, ?, ?, ?, ?, ?)
+                                                """, rows)
+                else:
+                    # noinspection SqlNoDataSourceInspection
+                    ret = self.conn.executemany(self._insert_if_new_time_sql,
+                                                (row + (row[0], ) for row in rows))
+                nr_inserted = ret.rowcount
+
+            return nr_inserted, nr_points - nr_inserted
+
+        except sqlite3.Error as e:
+            logger.error("during adding points, %s: %s" % (type(e), e))
+            return None
+
+    # without the unique time index (see _build_unique_time_index), the time is checked by the insertion
+    _insert_if_new_time_sql = """
+                              INSERT INTO data (time, long, lat, tss, draft, avg_depth)
+                              SELECT ?, ?, ?, ?, ?, ? WHERE NOT EXISTS (SELECT 1 FROM data WHERE time = ?)
+                              """
+
+    def merge_dbs(self, db_paths, t0=None, t1=None):
+        """Merge the points of other monitor dbs in the [t0, t1] time range
+
+        Each db is attached and its points are copied with a single INSERT ... SELECT (the points with a time
+        already present are skipped). Return the merge statistics as a dict.
+        """
+        stats = {
+            "merged_dbs": 0,
+            "failed_dbs": list(),
+            "inserted": 0,
+            "skipped": 0,
+        }
+
+        if not self.conn:
+            logger.error("missing db connection")
+            return stats
+
+        for db_path in db_paths:
+
+            if not os.path.exists(db_path):
+                logger.warning("skipping missing db: %s" % db_path)
+                stats["failed_dbs"].append(db_path)
+                continue
+
+            if os.path.abspath(db_path) == os.path.abspath(self.db_path):
+                logger.info("skipping db to merge with itself: %s" % db_path)
+                continue
+
+            ret = self._merge_db(db_path=db_path, t0=t0, t1=t1)
+            if ret is None:
+                stats["failed_dbs"].append(db_path)
+                continue
+
+            stats["merged_dbs"] += 1
+            stats["inserted"] += ret[0]
+            stats["skipped"] += ret[1]
+
+        logger.info("merged %d dbs -> inserted: %d, skipped: %d, failed dbs: %d"
+                    % (stats["merged_dbs"], stats["inserted"], stats["skipped"], len(stats["failed_dbs"])))
+        return stats
+
+    def _merge_db(self, db_path, t0=None, t1=None):
+        try:
+            # noinspection SqlNoDataSourceInspection
+            self.conn.execute("""ATTACH DATABASE ? AS merged""", (db_path, ))
+
+        except sqlite3.Error as e:
+            logger.error("while attaching %s, %s: %s" % (db_path, type(e), e))
+            return None
+
+        try:
+            # noinspection SqlNoDataSourceInspection
+            merged_version = self.conn.execute("""SELECT version FROM merged.library""").fetchone()[0]
+            if merged_version == 1:
+                self._register_v1_functions()
+                fields = "v1_time_to_us(time) AS time, v1_position_to_long(position) AS long, " \
+                         "v1_position_to_lat(position) AS lat, tss, draft, avg_depth"
+            elif merged_version == self.schema_version:
+                fields = "time, long, lat, tss, draft, avg_depth"
+            else:
+                raise sqlite3.DatabaseError("unsupported db version: %s" % merged_version)
+
+            conditions = list()
+            params = list()
+            if t0 is not None:
+                conditions.append("time >= ?")
+                params.append(self.timestamp_to_us(t0))
+            if t1 is not None:
+                conditions.append("time <= ?")
+                params.append(self.timestamp_to_us(t1))
+            # noinspection SqlNoDataSourceInspection
+            select = "SELECT %s FROM merged.data" % fields
+            if len(conditions) > 0:
+                select = "SELECT * FROM (%s) WHERE %s" % (select, " AND ".join(conditions))
+
+            with self.conn:
+                # noinspection SqlNoDataSourceInspection
+                nr_points = self.conn.execute("SELECT COUNT(*) FROM (%s)" % select, params).fetchone()[0]
+                if self.has_unique_time:
+                    # noinspection SqlNoDataSourceInspection
+                    ret = self.conn.execute("INSERT OR IGNORE INTO main.data (time, long, lat, tss, draft, avg_depth) "
+                                            "%s ORDER BY time" % select, params)
+                else:
+                    # a single point for each time, and only the times not already present
+                    # noinspection SqlNoDataSourceInspection
+                    ret = self.conn.execute("INSERT INTO main.data (time, long, lat, tss, draft, avg_depth) "
+                                            "SELECT time, long, lat, tss, draft, avg_depth FROM (%s) AS merged_data "
+                                            "WHERE NOT EXISTS (SELECT 1 FROM main.data WHERE main.data.time = "
+                                            "merged_data.time) GROUP BY time ORDER BY time" % select, params)
+                nr_inserted = ret.rowcount
+
+            logger.debug("merged %s -> inserted: %d, skipped: %d"
+                         % (db_path, nr_inserted, nr_points - nr_inserted))
+            return nr_inserted, nr_points - nr_inserted
+
+        except (sqlite3.Error, ValueError) as e:
+            logger.error("while merging %s, %s: %s" % (db_path, type(e), e))
+            return None
+
+        finally:
+            try:
+                # noinspection SqlNoDataSourceInspection
+                self.conn.execute("""DETACH DATABASE merged""")
+
+            except sqlite3.Error as e:
+                logger.warning("while detaching %s, %s: %s" % (db_path, type(e), e))
+
     def get_db_version(self):
         """Get the project db version"""
         if not self.conn:
@@ -217,19 +786,25 @@ class MonitorDb:
 
     def _add_point(self, timestamp, long, lat, tss, draft, avg_depth):
 
-        point = Point(long, lat)
-
         try:
-            # noinspection SqlNoDataSourceInspection
-            self.conn.execute("""
-                              INSERT INTO data VALUES (NULL, ?, ?, ?, ?, ?)
-                              """, (timestamp,
-                                    point,
-                                    tss,
-                                    draft,
-                                    avg_depth
-                                    ))
-            # logger.info("insert new %s pk in ssp" % self.tmp_ssp_pk)
+            time_us = self.timestamp_to_us(timestamp)
+            if self.has_unique_time:
+                # noinspection SqlNoDataSourceInspection
+                ret = self.conn.execute("""
+                                        INSERT OR IGNORE INTO data (time, long, lat, tss, draft, avg_depth)
+                                        VALUES (?, ?, ?, ?, ?, ?)
+                                        """, (time_us,
+                                              long,
+                                              lat,
+                                              tss,
+                                              draft,
+                                              avg_depth
+                                              ))
+            else:
+                ret = self.conn.execute(self._insert_if_new_time_sql, (time_us, long, lat, tss, draft, avg_depth,
+                                                                       time_us))
+            if ret.rowcount == 0:
+                logger.debug("skipped point with duplicated time: %s" % timestamp)
 
         except sqlite3.Error as e:
             logger.error("during point addition, %s: %s" % (type(e), e))
@@ -237,6 +812,29 @@ class MonitorDb:
 
         return True
 
+    # --- time conversions
+
+    @staticmethod
+    def utc_naive(timestamp):
+        """Convert a timezone-aware datetime to a naive one in UTC (naive datetimes are assumed as UTC)"""
+        if timestamp.tzinfo is None:
+            return timestamp
+        return timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+
+    @classmethod
+    def timestamp_to_us(cls, timestamp):
+        """Convert a datetime (or a datetime64) to the microseconds since the UTC epoch used in the db"""
+        if isinstance(timestamp, np.datetime64):
+            return int(timestamp.astype("datetime64[us]").astype(np.int64))
+        return (cls.utc_naive(timestamp) - cls.epoch) // timedelta(microseconds=1)
+
+    @classmethod
+    def us_to_timestamp(cls, us):
+        """Convert the microseconds since the UTC epoch used in the db to a naive UTC datetime"""
+        return cls.epoch + timedelta(microseconds=us)
+
+    # --- queries
+
     def timestamp_list(self):
         """Create and return the timestamp list (and the pk)"""
 
@@ -256,7 +854,7 @@ class MonitorDb:
                 times = list()
                 ids = list()
                 for item in ts_list:
-                    times.append(item[0])
+                    times.append(self.us_to_timestamp(item[0]))
                     ids.append(item[1])
 
                 return times, ids
@@ -271,18 +869,18 @@ class MonitorDb:
             return None
 
         ssp_list = list()
-        # noinspection SqlNoDataSourceInspection
-        sql = self.conn.execute("SELECT * FROM data ORDER BY time")
 
         try:
             with self.conn:
+                # noinspection SqlNoDataSourceInspection
+                sql = self.conn.execute("SELECT id, time, long, lat, tss, draft, avg_depth FROM data ORDER BY time")
                 for row in sql:
-                    ssp_list.append((row['id'],  # 0
-                                     row['time'],  # 1
-                                     row['position'],  # 2
-                                     row['tss'],  # 3
-                                     row['draft'],  # 4
-                                     row['avg_depth'],  # 5
+                    ssp_list.append((row[0],  # 0
+                                     self.us_to_timestamp(row[1]),  # 1
+                                     Point(row[2], row[3]),  # 2
+                                     row[4],  # 3
+                                     row[5],  # 4
+                                     row[6],  # 5
                                      ))
             return ssp_list
 
@@ -290,6 +888,258 @@ class MonitorDb:
             logger.error("%s: %s" % (type(e), e))
             return ssp_list
 
+    def points_between(self, t0=None, t1=None, columns=None):
+        """Return the points in the [t0, t1] time range as a dict of NumPy arrays
+
+        Times are returned as UTC datetime64[us], all the other columns as float64.
+        A None bound means that the range is open on that side.
+        """
+        if columns is None:
+            columns = self.point_columns
+        for column in columns:
+            if column not in self.point_columns:
+                raise RuntimeError("not passed a valid column: %s" % column)
+
+        if not self.conn:
+            logger.error("missing db connection")
+            return None
+
+        conditions = list()
+        params = list()
+        if t0 is not None:
+            conditions.append("time >= ?")
+            params.append(self.timestamp_to_us(t0))
+        if t1 is not None:
+            conditions.append("time <= ?")
+            params.append(self.timestamp_to_us(t1))
+        # noinspection SqlNoDataSourceInspection
+        sql = "SELECT %s FROM data" % ", ".join(columns)
+        if len(conditions) > 0:
+            sql += " WHERE %s" % " AND ".join(conditions)
+        sql += " ORDER BY time"
+
+        try:
+            with self.conn:
+                rows = self.conn.execute(sql, params).fetchall()
+
+        except sqlite3.Error as e:
+            logger.error("while retrieving points, %s: %s" % (type(e), e))
+            return None
+
+        return self._rows_to_columns(rows, columns)
+
+    def iter_points(self, batch_size=10000, t0=None, t1=None, columns=None):
+        """Iterate over the points in the [t0, t1] time range in batches of NumPy arrays (see points_between)
+
+        The batches are retrieved with keyset pagination on (time, id), so that the memory used does not depend on
+        the number of points (and a time stored more than once does not break the paging). Besides the point
+        columns, it is possible to retrieve the row 'id'.
+        """
+        if columns is None:
+            columns = self.point_columns
+        for column in columns:
+            if (column not in self.point_columns) and (column != "id"):
+                raise RuntimeError("not passed a valid column: %s" % column)
+        if batch_size < 1:
+            raise RuntimeError("not passed a valid batch size: %s" % batch_size)
+
+        if not self.conn:
+            logger.error("missing db connection")
+            return
+
+        # the time and the id are always retrieved since they are the pagination key
+        query_columns = ["time", "id"] + [column for column in columns if column not in ("time", "id")]
+        last_key = None
+
+        while True:
+            conditions = list()
+            params = list()
+            if last_key is not None:
+                # the range on the time lets SQLite walk the time index (instead of sorting at each batch)
+                conditions.append("time >= ? AND (time > ? OR (time = ? AND id > ?))")
+                params.extend([last_key[0], last_key[0], last_key[0], last_key[1]])
+            elif t0 is not None:
+                conditions.append("time >= ?")
+                params.append(self.timestamp_to_us(t0))
+            if t1 is not None:
+                conditions.append("time <= ?")
+                params.append(self.timestamp_to_us(t1))
+            # noinspection SqlNoDataSourceInspection
+            sql = "SELECT %s FROM data" % ", ".join(query_columns)
+            if len(conditions) > 0:
+                sql += " WHERE %s" % " AND ".join(conditions)
+            sql += " ORDER BY time, id LIMIT %d" % batch_size
+
+            try:
+                with self.conn:
+                    rows = self.conn.execute(sql, params).fetchall()
+
+            except sqlite3.Error as e:
+                logger.error("while iterating over points, %s: %s" % (type(e), e))
+                return
+
+            if len(rows) == 0:
+                return
+
+            last_key = (rows[-1][0], rows[-1][1])
+            batch = self._rows_to_columns(rows, query_columns)
+            yield {column: batch[column] for column in columns}
+
+            if len(rows) < batch_size:
+                return
+
+    def points_extent(self, t0=None, t1=None):
+        """Return number of points, position extent and mean, and tss range in the [t0, t1] time range"""
+        if not self.conn:
+            logger.error("missing db connection")
+            return None
+
+        conditions = list()
+        params = list()
+        if t0 is not None:
+            conditions.append("time >= ?")
+            params.append(self.timestamp_to_us(t0))
+        if t1 is not None:
+            conditions.append("time <= ?")
+            params.append(self.timestamp_to_us(t1))
+        # noinspection SqlNoDataSourceInspection
+        sql = "SELECT COUNT(*), MIN(long), MAX(long), AVG(long), MIN(lat), MAX(lat), AVG(lat), " \
+              "MIN(tss), MAX(tss) FROM data"
+        if len(conditions) > 0:
+            sql += " WHERE %s" % " AND ".join(conditions)
+
+        try:
+            with self.conn:
+                row = self.conn.execute(sql, params).fetchone()
+
+        except sqlite3.Error as e:
+            logger.error("while retrieving points extent, %s: %s" % (type(e), e))
+            return None
+
+        keys = ("count", "min_long", "max_long", "avg_long", "min_lat", "max_lat", "avg_lat", "min_tss", "max_tss")
+        return dict(zip(keys, row))
+
+    def points_in_bbox(self, west, south, east, north, t0=None, t1=None, columns=None):
+        """Return the points in a geographic box (and, optionally, a time range) as a dict of NumPy arrays
+
+        A west bound greater than the east one describes a box crossing the antimeridian.
+        """
+        if columns is None:
+            columns = self.point_columns
+        for column in columns:
+            if column not in self.point_columns:
+                raise RuntimeError("not passed a valid column: %s" % column)
+        if south > north:
+            raise RuntimeError("not passed a valid latitude range: %s, %s" % (south, north))
+
+        if not self.conn:
+            logger.error("missing db connection")
+            return None
+
+        if west <= east:
+            long_ranges = [(west, east)]
+        else:
+            long_ranges = [(west, 180.0), (-180.0, east)]
+
+        conditions = list()
+        params = list()
+        box_conditions = list()
+        for min_long, max_long in long_ranges:
+            box_conditions.append("(long >= ? AND long <= ?)")
+            params.extend([min_long, max_long])
+        conditions.append("(%s)" % " OR ".join(box_conditions))
+        conditions.append("lat >= ? AND lat <= ?")
+        params.extend([south, north])
+
+        if self.has_spatial_index:
+            # the R*Tree uses 32-bit float bounds: it only pre-filters, the exact test is on the data columns
+            rtree_conditions = list()
+            for min_long, max_long in long_ranges:
+                rtree_conditions.append("(max_long >= ? AND min_long <= ? AND max_lat >= ? AND min_lat <= ?)")
+                params.extend([min_long, max_long, south, north])
+            conditions.append("id IN (SELECT id FROM data_rtree WHERE %s)" % " OR ".join(rtree_conditions))
+
+        if t0 is not None:
+            conditions.append("time >= ?")
+            params.append(self.timestamp_to_us(t0))
+        if t1 is not None:
+            conditions.append("time <= ?")
+            params.append(self.timestamp_to_us(t1))
+
+        # noinspection SqlNoDataSourceInspection
+        sql = "SELECT %s FROM data WHERE %s ORDER BY time" % (", ".join(columns), " AND ".join(conditions))
+
+        try:
+            with self.conn:
+                rows = self.conn.execute(sql, params).fetchall()
+
+        except sqlite3.Error as e:
+            logger.error("while retrieving points in box, %s: %s" % (type(e), e))
+            return None
+
+        return self._rows_to_columns(rows, columns)
+
+    def summaries(self, resolution="minute", t0=None, t1=None):
+        """Return the time-bucket summaries overlapping the [t0, t1] time range as a dict of NumPy arrays
+
+        For each bucket: start time, number of samples, min/max/mean of tss, draft and avg depth, and the
+        position extent.
+        """
+        if resolution not in self.summary_resolutions:
+            raise RuntimeError("not passed a valid summary resolution: %s" % resolution)
+
+        if not self.conn:
+            logger.error("missing db connection")
+            return None
+
+        bucket_us = self.summary_resolutions[resolution] * 1000000
+        columns = ["time", "count"]
+        fields = ["bucket * %d" % bucket_us, "count"]
+        for value in self.summary_values:
+            columns.extend(["%s_min" % value, "%s_max" % value, "%s_mean" % value])
+            fields.extend(["%s_min" % value, "%s_max" % value, "%s_sum / count" % value])
+        columns.extend(["min_long", "max_long", "min_lat", "max_lat"])
+        fields.extend(["min_long", "max_long", "min_lat", "max_lat"])
+
+        conditions = list()
+        params = list()
+        if t0 is not None:
+            conditions.append("bucket >= ?")
+            params.append(self.timestamp_to_us(t0) // bucket_us)
+        if t1 is not None:
+            conditions.append("bucket <= ?")
+            params.append(self.timestamp_to_us(t1) // bucket_us)
+        # noinspection SqlNoDataSourceInspection
+        sql = "SELECT %s FROM summary_%s" % (", ".join(fields), resolution)
+        if len(conditions) > 0:
+            sql += " WHERE %s" % " AND ".join(conditions)
+        sql += " ORDER BY bucket"
+
+        try:
+            with self.conn:
+                rows = self.conn.execute(sql, params).fetchall()
+
+        except sqlite3.Error as e:
+            logger.error("while retrieving %s summaries, %s: %s" % (resolution, type(e), e))
+            return None
+
+        summaries = self._rows_to_columns(rows, columns)
+        summaries["count"] = summaries["count"].astype(np.int64)
+        return summaries
+
+    @staticmethod
+    def _rows_to_columns(rows, columns):
+        points = dict()
+        for idx, column in enumerate(columns):
+            if column == "time":
+                points[column] = np.fromiter((row[idx] for row in rows), dtype=np.int64,
+                                             count=len(rows)).astype("datetime64[us]")
+            elif column == "id":
+                points[column] = np.fromiter((row[idx] for row in rows), dtype=np.int64, count=len(rows))
+            else:
+                points[column] = np.fromiter((row[idx] for row in rows), dtype=np.float64, count=len(rows))
+        return points
+
     def point_by_id(self, pid):
         if not self.conn:
             logger.error("missing db connection")
@@ -300,11 +1150,12 @@ class MonitorDb:
         with self.conn:
             try:
                 # noinspection SqlNoDataSourceInspection
-                row = self.conn.execute("SELECT * FROM data WHERE id=?", (pid,)).fetchone()
+                row = self.conn.execute("SELECT time, long, lat, tss, draft, avg_depth FROM data WHERE id=?",
+                                        (pid,)).fetchone()
 
-                timestamp = row[1]
-                long = row[2].x
-                lat = row[2].y
+                timestamp = self.us_to_timestamp(row[0])
+                long = row[1]
+                lat = row[2]
                 tss = row[3]
                 draft = row[4]
                 avg_depth = row[5]
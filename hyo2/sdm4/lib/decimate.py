@@ -0,0 +1,228 @@
+import copy
+import logging
+import math
+from abc import ABCMeta, abstractmethod
+from typing import Optional
+
+import numpy as np
+
+from hyo2.sdm4.lib.samples import SampleStore
+
+logger = logging.getLogger(__name__)
+
+
+class Decimator(metaclass=ABCMeta):
+    """Base class for the ingest decimation policies
+
+    A policy can be used in two ways:
+    - on the live ingest, by calling accept() for each new sample (the state is kept between the calls)
+    - on imported data, by calling mask() on the whole series (applying the policy from a clean state)
+
+    The first sample is always kept.
+    """
+
+    def __init__(self) -> None:
+        self._nr_accepted = 0
+        self._nr_rejected = 0
+
+    def reset(self) -> None:
+        self._nr_accepted = 0
+        self._nr_rejected = 0
+
+    def accept(self, timestamp, long: float, lat: float, tss: float, draft: float, avg_depth: float) -> bool:
+        """Return True if the sample has to be kept (updating the policy state)"""
+        keep = self._accept(time=self.to_seconds(timestamp), long=long, lat=lat, tss=tss, draft=draft,
+                            avg_depth=avg_depth)
+        if keep:
+            self._nr_accepted += 1
+        else:
+            self._nr_rejected += 1
+        return keep
+
+    @abstractmethod
+    def _accept(self, time: float, long: float, lat: float, tss: float, draft: float, avg_depth: float) -> bool:
+        pass
+
+    def mask(self, timestamps, longs, lats, tsss, drafts, avg_depths) -> np.ndarray:
+        """Return the boolean mask of the samples to keep in a chronological series"""
+        times = self.to_seconds_array(timestamps)
+        columns = {
+            "long": np.asarray(longs, dtype=np.float64),
+            "lat": np.asarray(lats, dtype=np.float64),
+            "tss": np.asarray(tsss, dtype=np.float64),
+            "draft": np.asarray(drafts, dtype=np.float64),
+            "avg_depth": np.asarray(avg_depths, dtype=np.float64),
+        }
+        for name, values in columns.items():
+            if len(values) != len(times):
+                raise RuntimeError("invalid length for %s: %d (expected: %d)" % (name, len(values), len(times)))
+
+        keep = np.zeros(len(times), dtype=bool)
+        if len(times) == 0:
+            return keep
+        self._mask(keep=keep, times=times, **columns)
+        return keep
+
+    def _mask(self, keep: np.ndarray, times: np.ndarray, long: np.ndarray, lat: np.ndarray, tss: np.ndarray,
+              draft: np.ndarray, avg_depth: np.ndarray) -> None:
+        # default: apply the stateful policy on a clean copy
+        policy = copy.copy(self)
+        policy.reset()
+        for idx in range(len(times)):
+            keep[idx] = policy._accept(time=times[idx], long=long[idx], lat=lat[idx], tss=tss[idx],
+                                       draft=draft[idx], avg_depth=avg_depth[idx])
+
+    @classmethod
+    def to_seconds(cls, timestamp) -> float:
+        """Convert a (naive UTC or aware) datetime, or a datetime64, to seconds since the epoch"""
+        return SampleStore.to_datetime64(timestamp).astype(np.int64) / 1e6
+
+    @classmethod
+    def to_seconds_array(cls, timestamps) -> np.ndarray:
+        return SampleStore.to_datetime64_array(timestamps).astype(np.int64) / 1e6
+
+    @property
+    def nr_accepted(self) -> int:
+        return self._nr_accepted
+
+    @property
+    def nr_rejected(self) -> int:
+        return self._nr_rejected
+
+    def __repr__(self) -> str:
+        msg = "<%s>\n" % self.__class__.__name__
+        msg += "  <accepted: %d>\n" % self._nr_accepted
+        msg += "  <rejected: %d>\n" % self._nr_rejected
+        return msg
+
+
+class TimeDecimator(Decimator):
+    """Keep a sample when at least the time step (in seconds) is elapsed since the latest kept sample"""
+
+    def __init__(self, step: float) -> None:
+        super().__init__()
+        if step <= 0.0:
+            raise RuntimeError("invalid time step: %s" % step)
+        self.step = step
+
+        self._last_time = None
+
+    def reset(self) -> None:
+        super().reset()
+        self._last_time = None
+
+    def _accept(self, time: float, long: float, lat: float, tss: float, draft: float, avg_depth: float) -> bool:
+        if (self._last_time is not None) and ((time - self._last_time) < self.step):
+            return False
+        self._last_time = time
+        return True
+
+    def _mask(self, keep: np.ndarray, times: np.ndarray, long: np.ndarray, lat: np.ndarray, tss: np.ndarray,
+              draft: np.ndarray, avg_depth: np.ndarray) -> None:
+        # jump from a kept sample to the next one
+        idx = 0
+        while idx < len(times):
+            keep[idx] = True
+            idx = max(idx + 1, int(np.searchsorted(times, times[idx] + self.step, side="left")))
+
+
+class DistanceDecimator(Decimator):
+    """Keep a sample when the along-track distance (in meters) since the latest kept sample reaches the step"""
+
+    earth_radius = 6371008.8  # mean Earth radius, in meters
+
+    def __init__(self, step: float) -> None:
+        super().__init__()
+        if step <= 0.0:
+            raise RuntimeError("invalid distance step: %s" % step)
+        self.step = step
+
+        self._last_long = None
+        self._last_lat = None
+        self._distance = 0.0
+
+    def reset(self) -> None:
+        super().reset()
+        self._last_long = None
+        self._last_lat = None
+        self._distance = 0.0
+
+    @classmethod
+    def distances(cls, longs: np.ndarray, lats: np.ndarray) -> np.ndarray:
+        """Haversine distances (in meters) between consecutive positions"""
+        lons = np.radians(longs)
+        lats = np.radians(lats)
+        d_lons = np.diff(lons)
+        d_lats = np.diff(lats)
+        a = np.sin(d_lats / 2.0) ** 2 + np.cos(lats[:-1]) * np.cos(lats[1:]) * np.sin(d_lons / 2.0) ** 2
+        return 2.0 * cls.earth_radius * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+    def _accept(self, time: float, long: float, lat: float, tss: float, draft: float, avg_depth: float) -> bool:
+        if self._last_long is None:
+            self._last_long = long
+            self._last_lat = lat
+            return True
+
+        # the distance is accumulated along the track (also for the rejected samples)
+        self._distance += float(self.distances(np.array([self._last_long, long]), np.array([self._last_lat, lat]))[0])
+        self._last_long = long
+        self._last_lat = lat
+        if self._distance < self.step:
+            return False
+        self._distance = 0.0
+        return True
+
+    def _mask(self, keep: np.ndarray, times: np.ndarray, long: np.ndarray, lat: np.ndarray, tss: np.ndarray,
+              draft: np.ndarray, avg_depth: np.ndarray) -> None:
+        along_track = np.concatenate(([0.0], np.cumsum(self.distances(long, lat))))
+        idx = 0
+        while idx < len(times):
+            keep[idx] = True
+            idx = max(idx + 1, int(np.searchsorted(along_track, along_track[idx] + self.step, side="left")))
+
+
+class DeadBandDecimator(Decimator):
+    """Keep a sample when a value moves by more than its threshold from the latest kept sample
+
+    The thresholds are for the transducer sound speed (m/s), the draft (m), and the average depth (m).
+    A None threshold disables the check for that value. The optional max interval (in seconds) keeps
+    a sample also when the values are steady, to avoid long gaps.
+    """
+
+    def __init__(self, tss: Optional[float] = None, draft: Optional[float] = None,
+                 avg_depth: Optional[float] = None, max_interval: Optional[float] = None) -> None:
+        super().__init__()
+        if (tss is None) and (draft is None) and (avg_depth is None):
+            raise RuntimeError("at least a threshold is required")
+        for name, value in (("tss", tss), ("draft", draft), ("avg_depth", avg_depth), ("max_interval", max_interval)):
+            if (value is not None) and (value < 0.0):
+                raise RuntimeError("invalid %s threshold: %s" % (name, value))
+        self.thresholds = {"tss": tss, "draft": draft, "avg_depth": avg_depth}
+        self.max_interval = max_interval
+
+        self._last_time = None
+        self._last_values = None
+
+    def reset(self) -> None:
+        super().reset()
+        self._last_time = None
+        self._last_values = None
+
+    def _accept(self, time: float, long: float, lat: float, tss: float, draft: float, avg_depth: float) -> bool:
+        values = {"tss": tss, "draft": draft, "avg_depth": avg_depth}
+
+        keep = self._last_values is None
+        if not keep and (self.max_interval is not None):
+            keep = (time - self._last_time) >= self.max_interval
+        if not keep:
+            for name, threshold in self.thresholds.items():
+                if threshold is None:
+                    continue
+                if math.fabs(values[name] - self._last_values[name]) > threshold:
+                    keep = True
+                    break
+
+        if keep:
+            self._last_time = time
+            self._last_values = values
+        return keep
@@ -0,0 +1,12 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+# the compiled extension is built by setup.py, the pure-Python implementation is used when it is not available
+try:
+    from hyo2.sdm4.lib.estimate.casttime.casttime import CastTime
+except ImportError as e:
+    logger.info("CastTime extension not available -> using the pure-Python implementation (%s)" % e)
+    from hyo2.sdm4.lib.estimate.casttime.pycasttime import CastTime
+
+casttime_backend = CastTime.backend
@@ -0,0 +1,86 @@
+import logging
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import Lock
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class EstimationWorker:
+    """Run the estimation jobs in a dedicated thread, one at a time
+
+    A job is submitted only when the previous one is completed, so the caller never waits on the estimation:
+    it polls the returned future and publishes the result when done.
+    """
+
+    def __init__(self, name: Optional[str] = "EstimationWorker") -> None:
+        self._name = name
+        self._executor = None  # type: Optional[ThreadPoolExecutor]
+        self._future = None  # type: Optional[Future]
+        self._stats_lock = Lock()
+
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._last_duration = 0.0
+        self._max_duration = 0.0
+
+    @property
+    def busy(self) -> bool:
+        return (self._future is not None) and not self._future.done()
+
+    def submit(self, job: Callable, *args, **kwargs) -> Optional[Future]:
+        """Submit a job, return None if the previous one is still running"""
+        if self.busy:
+            return None
+
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=self._name)
+
+        with self._stats_lock:
+            self._submitted += 1
+        self._future = self._executor.submit(self._run, job, *args, **kwargs)
+        return self._future
+
+    def _run(self, job: Callable, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            ret = job(*args, **kwargs)
+
+        except Exception:
+            with self._stats_lock:
+                self._failed += 1
+            raise
+
+        finally:
+            duration = time.perf_counter() - start
+            with self._stats_lock:
+                self._last_duration = duration
+                self._max_duration = max(self._max_duration, duration)
+
+        with self._stats_lock:
+            self._completed += 1
+        return ret
+
+    def shutdown(self) -> None:
+        """Stop the thread without waiting for the running job (its result is discarded)"""
+        executor = self._executor
+        if executor is None:
+            return
+
+        self._executor = None
+        self._future = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    @property
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                "busy": self.busy,
+                "submitted": self._submitted,
+                "completed": self._completed,
+                "failed": self._failed,
+                "last_duration": self._last_duration,
+                "max_duration": self._max_duration,
+            }
@@ -12,6 +12,9 @@ logger = logging.getLogger(__name__)
 class ExportDb:
     """Class that exports sound speed db data"""
 
+    # number of points retrieved from the db at a time
+    batch_size = 10000
+
     def __init__(self, db):
         _ = GdalAux()
         self.db = db
@@ -62,33 +65,37 @@ class ExportDb:
             with GdalAux.create_ogr_data_source(ogr_format=ogr_format, output_path=output) as ds:
                 lyr = self._create_ogr_lyr_and_fields(ds)
 
-                rows = self.db.list_points()
-                if rows is None:
-                    raise RuntimeError("Unable to retrieve profiles. Empty database?")
-                if len(rows) == 0:
-                    raise RuntimeError("Unable to retrieve profiles. Empty database?")
+                nr_points = 0
+                for batch in self.db.iter_points(batch_size=self.batch_size,
+                                                 columns=("id", "time", "long", "lat", "tss", "draft", "avg_depth")):
+                    times = batch["time"].tolist()
+                    for idx, timestamp in enumerate(times):
 
-                for row in rows:
+                        ft = ogr.Feature(lyr.GetLayerDefn())
+                        ft.SetField('id', int(batch["id"][idx]))
+                        ft.SetField('time', timestamp.isoformat())
+                        ft.SetField('tss', float(batch["tss"][idx]))
+                        ft.SetField('draft', float(batch["draft"][idx]))
+                        ft.SetField('avg_depth', float(batch["avg_depth"][idx]))
 
-                    ft = ogr.Feature(lyr.GetLayerDefn())
-                    ft.SetField('id', int(row[0]))
-                    ft.SetField('time', row[1].isoformat())
-                    ft.SetField('tss', float(row[3]))
-                    ft.SetField('draft', float(row[4]))
-                    ft.SetField('avg_depth', float(row[5]))
+                        pt = ogr.Geometry(ogr.wkbPoint)
+                        pt.SetPointZM(0, float(batch["long"][idx]), float(batch["lat"][idx]),
+                                      float(batch["draft"][idx]), float(batch["tss"][idx]))
 
-                    pt = ogr.Geometry(ogr.wkbPoint)
-                    pt.SetPointZM(0, float(row[2].x), float(row[2].y), float(row[4]), float(row[3]))
+                        try:
+                            ft.SetGeometry(pt)
 
-                    try:
-                        ft.SetGeometry(pt)
+                        except Exception as e:
+                            RuntimeError("%s > pt: %s, %s" % (e, batch["long"][idx], batch["lat"][idx]))
 
-                    except Exception as e:
-                        RuntimeError("%s > pt: %s, %s" % (e, row[2].x, row[2].y))
+                        if lyr.CreateFeature(ft) != 0:
+                            raise RuntimeError("Unable to create feature")
+                        ft.Destroy()
 
-                    if lyr.CreateFeature(ft) != 0:
-                        raise RuntimeError("Unable to create feature")
-                    ft.Destroy()
+                    nr_points += len(times)
+
+                if nr_points == 0:
+                    raise RuntimeError("Unable to retrieve profiles. Empty database?")
 
         except RuntimeError as e:
             logger.error("%s" % e)
@@ -106,22 +113,19 @@ class ExportDb:
         if os.path.exists(output_color):
             os.remove(output_color)
 
-        # first retrieve the point positions
-        lats = list()
-        longs = list()
-        tsss = list()
-        rows = self.db.list_points()
-        for row in rows:
-            lats.append(row[2].y)
-            longs.append(row[2].x)
-            tsss.append(row[3])
+        # first retrieve the extent of the point positions
+        extent = self.db.points_extent()
+        if (extent is None) or (extent["count"] == 0):
+            logger.error("Unable to retrieve points. Empty database?")
+            return
+        nr_points = extent["count"]
 
         # retrieve geospatial info
-        min_lat, max_lat, avg_lat = min(lats), max(lats), sum(lats) / len(lats)
+        min_lat, max_lat, avg_lat = extent["min_lat"], extent["max_lat"], extent["avg_lat"]
         range_lat = max_lat - min_lat
-        min_long, max_long, avg_long = min(longs), max(longs), sum(longs) / len(longs)
+        min_long, max_long, avg_long = extent["min_long"], extent["max_long"], extent["avg_long"]
         range_long = max_long - min_long
-        min_tss, max_tss = min(tsss), max(tsss)
+        min_tss, max_tss = extent["min_tss"], extent["max_tss"]
         range_tss = max_tss - min_tss
         logger.debug("lat: %s / %s / %s" % (min_lat, max_lat, range_lat))
         logger.debug("long: %s / %s / %s" % (min_long, max_long, range_long))
@@ -176,34 +180,33 @@ class ExportDb:
             y_min = min_n - buffer
             y_max = max_n + buffer
 
-        if len(lats) < 40:
+        if nr_points < 40:
             x_pixels = 100
-        elif len(lats) < 100:
+        elif nr_points < 100:
             x_pixels = 200
-        elif len(lats) < 1000:
+        elif nr_points < 1000:
             x_pixels = 400
         else:
             x_pixels = 1000
         pixel_size = (x_max - x_min) / x_pixels
         y_pixels = int((y_max - y_min) / pixel_size) + 1
-        logger.debug("pixels -> x: %s, y: %s, size: %s, samples: %s" % (x_pixels, y_pixels, pixel_size, len(lats)))
+        logger.debug("pixels -> x: %s, y: %s, size: %s, samples: %s" % (x_pixels, y_pixels, pixel_size, nr_points))
 
+        # then grid the points, one batch at a time
         array = np.zeros((y_pixels, x_pixels), dtype=np.float32)
-        for idx, lat in enumerate(lats):
+        for batch in self.db.iter_points(batch_size=self.batch_size, columns=("long", "lat", "tss")):
 
             if use_geographic:
-                idx_lat = y_pixels - 1 - int((lat - y_min + pixel_size / 2.0) / pixel_size)
-                idx_long = int((longs[idx] - x_min - pixel_size / 2.0) / pixel_size)
+                xs = batch["long"]
+                ys = batch["lat"]
             else:
-                point = ogr.Geometry(ogr.wkbPoint)
-                point.AddPoint(longs[idx], lat)
-                point.Transform(coord_transform)
-                e = point.GetX()
-                n = point.GetY()
-
-                idx_lat = y_pixels - 1 - int((n - y_min + pixel_size / 2.0) / pixel_size)
-                idx_long = int((e - x_min - pixel_size / 2.0) / pixel_size)
-            array[idx_lat, idx_long] = tsss[idx]
+                points = coord_transform.TransformPoints(np.column_stack((batch["long"], batch["lat"])).tolist())
+                xs = np.array([point[0] for point in points])
+                ys = np.array([point[1] for point in points])
+
+            idx_lats = y_pixels - 1 - ((ys - y_min + pixel_size / 2.0) / pixel_size).astype(int)
+            idx_longs = ((xs - x_min - pixel_size / 2.0) / pixel_size).astype(int)
+            array[idx_lats, idx_longs] = batch["tss"]
 
         driver = gdal.GetDriverByName('GTiff')
 
@@ -0,0 +1,145 @@
+import logging
+from enum import Enum
+from threading import Lock
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class IngestMode(Enum):
+    POLLING = 0  # the latest SIS data are sampled at each monitoring step
+    CALLBACK = 1  # every XYZ datagram received by the SIS listener is ingested
+
+
+def read_sis_sample(sis) -> Optional[tuple]:
+    """Return the latest (timestamp, latitude, longitude, tss, draft, avg depth) from a SIS listener, if complete"""
+
+    # be sure that we have both navigation and depth datagrams
+    if sis.nav is None:
+        return None
+    if sis.nav_timestamp is None:
+        return None
+    if (sis.nav_latitude is None) or (sis.nav_longitude is None):
+        return None
+    if sis.xyz is None:
+        return None
+    if sis.xyz_transducer_sound_speed is None:
+        return None
+
+    return (sis.xyz.dg_time, sis.nav_latitude, sis.nav_longitude, sis.xyz_transducer_sound_speed,
+            sis.xyz_transducer_depth, sis.xyz_mean_depth)
+
+
+class SisIngest:
+    """Push each new XYZ datagram received by a SIS listener to a callback
+
+    The listener does not provide a subscription mechanism, so its parse method is wrapped (on the instance):
+    after each parsed datagram, a new XYZ datagram is converted to a sample and passed to the callback.
+    The callback is run in the listener thread. A listener without a replaceable parse method cannot be attached.
+    """
+
+    def __init__(self, callback: Callable[..., None]) -> None:
+        self._callback = callback
+        self._lock = Lock()
+        self._listener = None
+        self._original_parse = None
+        self._had_own_parse = False
+
+        self._last_xyz = None
+        self._last_dgtime = None
+        self._received = 0
+        self._skipped = 0
+        self._errors = 0
+
+    @property
+    def listener(self):
+        return self._listener
+
+    def attach(self, listener) -> bool:
+        """Start receiving the datagrams of the passed listener (detaching from the previous one, if any)
+
+        Return False if the listener does not expose a usable parse hook.
+        """
+        with self._lock:
+            if listener is self._listener:
+                return True
+
+            self._detach()
+
+            original_parse = getattr(listener, "parse", None)
+            if not callable(original_parse):
+                logger.warning("listener without a parse method: %s" % listener.__class__.__name__)
+                return False
+            had_own_parse = "parse" in getattr(listener, "__dict__", dict())
+
+            def parse(*args, **kwargs):
+                ret = original_parse(*args, **kwargs)
+                self._on_parsed(listener)
+                return ret
+
+            try:
+                listener.parse = parse
+
+            except (AttributeError, TypeError) as e:
+                logger.warning("unable to hook the parse method of %s: %s" % (listener.__class__.__name__, e))
+                return False
+
+            self._listener = listener
+            self._original_parse = original_parse
+            self._had_own_parse = had_own_parse
+            self._last_xyz = None
+            logger.debug("attached to listener: %s" % listener.__class__.__name__)
+            return True
+
+    def detach(self) -> None:
+        with self._lock:
+            self._detach()
+
+    def _detach(self) -> None:
+        if self._listener is None:
+            return
+
+        if self._had_own_parse:
+            self._listener.parse = self._original_parse
+        else:
+            del self._listener.parse
+        logger.debug("detached from listener: %s" % self._listener.__class__.__name__)
+
+        self._listener = None
+        self._original_parse = None
+        self._had_own_parse = False
+
+    def _on_parsed(self, listener) -> None:
+        xyz = listener.xyz
+        if (xyz is None) or (xyz is self._last_xyz):
+            return
+        self._last_xyz = xyz
+
+        try:
+            sample = read_sis_sample(listener)
+            if sample is None:
+                self._skipped += 1
+                return
+
+            # avoid to ingest a datagram older than the latest one
+            timestamp = sample[0]
+            if (self._last_dgtime is not None) and (timestamp <= self._last_dgtime):
+                self._skipped += 1
+                return
+            self._last_dgtime = timestamp
+
+            self._received += 1
+            self._callback(*sample)
+
+        except Exception as e:
+            # never break the listener thread
+            self._errors += 1
+            logger.warning("while ingesting SIS datagram: %s" % e)
+
+    @property
+    def stats(self) -> dict:
+        return {
+            "received": self._received,
+            "skipped": self._skipped,
+            "errors": self._errors,
+        }
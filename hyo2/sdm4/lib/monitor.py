@@ -3,16 +3,25 @@ import logging
 import math
 import os
 import statistics
-import traceback
-from threading import Timer, Lock
+from concurrent.futures import Future
+from threading import Lock
 from typing import Optional
 
+import numpy as np
+
 from hyo2.abc2.lib.gdal_aux import GdalAux
 from hyo2.abc2.lib.package.pkg_helper import PkgHelper
+from hyo2.sdm4.lib.casts import CastIndex, CastTracker, ProfileCache
 from hyo2.sdm4.lib.db import MonitorDb
+from hyo2.sdm4.lib.decimate import Decimator
 from hyo2.sdm4.lib.estimate.abstractestimator import EstimatorType, EstimationModes
-from hyo2.sdm4.lib.estimate.casttime.casttime import CastTime
+from hyo2.sdm4.lib.estimate.casttime import CastTime
+from hyo2.sdm4.lib.estimate.worker import EstimationWorker
+from hyo2.sdm4.lib.ingest import IngestMode, SisIngest, read_sis_sample
 from hyo2.sdm4.lib.readers.emseries import EmSeries
+from hyo2.sdm4.lib.samples import SampleStore, SampleSnapshot
+from hyo2.sdm4.lib.scheduler import FixedRateScheduler
+from hyo2.sdm4.lib.writer import DbWriter
 from hyo2.ssm2.lib.soundspeed import SoundSpeedLibrary
 
 logger = logging.getLogger(__name__)
@@ -41,21 +50,58 @@ class SurveyDataMonitor:
         self._past_cast_time = None
         self._next_cast_time = None
 
-        self._times = list()
-        self._lats = list()
-        self._longs = list()
-        self._tsss = list()
-        self._drafts = list()
-        self._depths = list()
+        # only the latest samples are kept in memory, the older ones are read back from the session db
+        self._retention_samples = 20000
+        self._retention_span = None  # type: Optional[datetime.timedelta]
+        # samples read at once from a session db
+        self._read_back_batch_size = 10000
+        self._samples = SampleStore(max_size=self._retention_samples, max_span=self._retention_span)
+        # the sample writers serialize on this lock and publish a new snapshot after each change, so that
+        # the readers never block the ingest
+        self._samples_lock = Lock()
+        self._snapshot = self._samples.snapshot()
         self._data_info = str()
+        self._sis_info = str()
 
         self._lock = Lock()
         self._external_lock = False
+        # the SIS samples are counted by both the monitoring and the listener threads (never on the data lock
+        # held by the GUI, to not stall the listener)
+        self._counter_lock = Lock()
         self.base_name = None
 
+        # how the SIS data are ingested (for the callback mode, the listener pushes every XYZ datagram)
+        self._ingest_mode = IngestMode.POLLING
+        self._sis_ingest = SisIngest(callback=self._on_sis_sample)
+        # optional decimation of the ingested samples (when None, all the live samples are stored and the
+        # Kongsberg files are decimated with the reader default)
+        self._decimator = None  # type: Optional[Decimator]
+
+        # single long-lived thread running the monitoring at a fixed rate (created by start_monitor)
+        self._scheduler = None  # type: Optional[FixedRateScheduler]
+        self._scheduler_stop_timeout = 10.0
+
+        # background writer to the session db (started by start_monitor, flushed by stop_monitor)
+        self._writer = None  # type: Optional[DbWriter]
+        self._writer_stop_timeout = 10.0
+
         self._cast_time = CastTime()
         self._cast_time.plotting_mode = False
+        logger.debug("CastTime backend: %s" % self._cast_time.backend)
         self._cast_time_updated = False
+        # the estimation runs in a dedicated thread, on a copy of the estimator published when completed
+        self._estimation_worker = EstimationWorker(name="CastTimeEstimation")
+        self._estimation = None  # type: Optional[Future]
+        self._pending_casts = list()  # the (cast datetime, pk) still to be estimated
+        # a failed estimation is retried: after too many consecutive failures, the oldest pending cast is dropped
+        self._estimation_failures = 0
+        self._max_estimation_failures = 3
+        # the casts in the SSM project are listed again only when the project db changes
+        self._casts = CastTracker(ssm=self._ssm)
+        # the profiles are deserialized once, and reused until the project db changes
+        self._profiles = ProfileCache(ssm=self._ssm, tracker=self._casts)
+        # the cast positions are indexed in memory for the plots
+        self._cast_index = CastIndex(ssm=self._ssm)
 
         self._active_estimator = EstimatorType.CAST_TIME
 
@@ -120,46 +166,71 @@ class SurveyDataMonitor:
         return self._next_cast_time
 
     @property
-    def times(self) -> list:
-        if not self._external_lock:
-            raise RuntimeError("Accessing resources without locking them!")
-        return self._times
+    def retention_samples(self) -> Optional[int]:
+        return self._retention_samples
+
+    @retention_samples.setter
+    def retention_samples(self, value: Optional[int]) -> None:
+        self._samples_lock.acquire()
+        try:
+            self._samples.max_size = value
+            self._retention_samples = value
+            self._publish_snapshot()
+        finally:
+            self._samples_lock.release()
 
     @property
-    def lats(self) -> list:
-        if not self._external_lock:
-            raise RuntimeError("Accessing resources without locking them!")
-        return self._lats
+    def retention_span(self) -> Optional[datetime.timedelta]:
+        return self._retention_span
+
+    @retention_span.setter
+    def retention_span(self, value: Optional[datetime.timedelta]) -> None:
+        self._samples_lock.acquire()
+        try:
+            self._samples.max_span = value
+            self._retention_span = value
+            self._publish_snapshot()
+        finally:
+            self._samples_lock.release()
+
+    def _publish_snapshot(self) -> None:
+        """Publish the current samples (to be called by the writers, holding the samples lock)"""
+        self._snapshot = self._samples.snapshot()
+
+    def snapshot(self) -> SampleSnapshot:
+        """Return an immutable snapshot of the latest samples (no locking required)"""
+        return self._snapshot
+
+    def samples_since(self, seq: int, generation: Optional[int] = None) -> dict:
+        """Return only the samples added after the passed sequence number (see SampleSnapshot.samples_since)"""
+        return self._snapshot.samples_since(seq=seq, generation=generation)
 
     @property
-    def longs(self) -> list:
-        if not self._external_lock:
-            raise RuntimeError("Accessing resources without locking them!")
-        return self._longs
+    def times(self) -> np.ndarray:
+        return self._snapshot.column("time")
 
     @property
-    def tsss(self) -> list:
-        if not self._external_lock:
-            raise RuntimeError("Accessing resources without locking them!")
-        return self._tsss
+    def lats(self) -> np.ndarray:
+        return self._snapshot.column("lat")
 
     @property
-    def drafts(self) -> list:
-        if not self._external_lock:
-            raise RuntimeError("Accessing resources without locking them!")
-        return self._drafts
+    def longs(self) -> np.ndarray:
+        return self._snapshot.column("long")
 
     @property
-    def depths(self) -> list:
-        if not self._external_lock:
-            raise RuntimeError("Accessing resources without locking them!")
-        return self._depths
+    def tsss(self) -> np.ndarray:
+        return self._snapshot.column("tss")
 
     @property
-    def data_info(self) -> str:
-        if not self._external_lock:
-            raise RuntimeError("Accessing resources without locking them!")
+    def drafts(self) -> np.ndarray:
+        return self._snapshot.column("draft")
+
+    @property
+    def depths(self) -> np.ndarray:
+        return self._snapshot.column("avg_depth")
 
+    @property
+    def data_info(self) -> str:
         return self._data_info
 
     @property
@@ -178,6 +249,28 @@ class SurveyDataMonitor:
         # logger.debug("latest info: %s" % info)
         return info
 
+    @property
+    def ingest_mode(self) -> IngestMode:
+        return self._ingest_mode
+
+    @ingest_mode.setter
+    def ingest_mode(self, value: IngestMode) -> None:
+        logger.debug("ingest mode: %s" % value)
+        self._ingest_mode = value
+        if not self._active:
+            self._sis_ingest.detach()
+
+    @property
+    def decimator(self) -> Optional[Decimator]:
+        return self._decimator
+
+    @decimator.setter
+    def decimator(self, value: Optional[Decimator]) -> None:
+        logger.debug("decimator: %s" % value)
+        if value is not None:
+            value.reset()
+        self._decimator = value
+
     @property
     def active(self) -> bool:
         return self._active
@@ -220,30 +313,32 @@ class SurveyDataMonitor:
         return "Unknown"
 
     def monitoring(self) -> None:
-        if not self._active:
-            logger.debug("Stop monitoring")
-            return
-
-        if self._pause:
-            logger.debug("Pause monitoring")
-            Timer(self._timing, self.monitoring).start()
-            return
-
+        """Single monitoring step, run at a fixed rate by the scheduler"""
         # logger.debug("Monitoring every %.1f seconds" % self._timing)
-        self._data_info = "Settings:\n" \
-                          "- Estimator: %s\n" % self.active_estimator_name()
+        data_info = "Settings:\n" \
+                    "- Estimator: %s\n" % self.active_estimator_name()
         if self._active_estimator != EstimatorType.DISABLED:
-            self._data_info += "- Default draft: %.2f m\n" % self._default_draft
-            self._data_info += "- Average depth: %.2f m\n" % self._avg_depth
+            data_info += "- Default draft: %.2f m\n" % self._default_draft
+            data_info += "- Average depth: %.2f m\n" % self._avg_depth
 
         # Check if SIS is available and pinging
-        if self._ssm.listeners.sis.is_alive():
+        self._update_sis_ingest()
+        if self._ingest_mode == IngestMode.CALLBACK:
+            # the samples are pushed by the listener
+            if self._has_sis_data:
+                logger.debug("#%04d: monitor: %s" % (self._counter, self._sis_ingest.stats))
+                data_info += self._sis_info
+
+        elif self._ssm.listeners.sis.is_alive():
             msg = self._retrieve_from_sis()
             if len(msg) > 0:
                 if (self._counter % 1) == 0:
                     logger.debug("#%04d: monitor: %s" % (self._counter, msg))
-                self._has_sis_data = True
-                self._counter += 1
+                self._count_sis_sample()
+                data_info += self._sis_info
+
+        # the info is published as a whole
+        self._data_info = data_info
 
         if self._active_estimator == EstimatorType.CAST_TIME:
             logger.debug("Estimate using CastTime")
@@ -256,111 +351,184 @@ class SurveyDataMonitor:
             # logger.warning("Estimation disabled")
             pass
 
-        Timer(self._timing, self.monitoring).start()
-
     def _estimate_with_cast_time(self) -> None:
+        # the estimation runs in the worker thread: its result is published once completed
+        if self._estimation is not None:
+            if not self._estimation.done():
+                logger.debug("CastTime estimation in progress")
+                return
+            self._publish_cast_time(self._estimation)
+            self._estimation = None
 
-        rows = self._ssm.db_timestamp_list()
+        new_rows = self._casts.refresh()
+        rows = self._casts.rows
         nr_rows = len(rows)
         if nr_rows == 0:
             logger.debug("The database is empty")
             return
 
         # logger.debug("DB has %d casts" % nr_rows)
-        cur_datetime = rows[-1][0]
-        cur_pk = rows[-1][1]
+        cur_datetime = self._casts.last_time
+        cur_pk = self._casts.last_pk
         if self._past_cast_time is None:
-
             self._past_cast_time = cur_datetime
             logger.debug("First cast from DB: #%d -> %s" % (cur_pk, self._past_cast_time))
+            # the latest two casts are used
+            self._pending_casts.extend(rows[-2:])
 
-            if nr_rows > 1:
-                pre_cur_datetime = rows[-2][0]
-                pre_cur_pk = rows[-2][1]
+        elif (len(new_rows) > 0) and (cur_datetime > self._past_cast_time):
+            self._past_cast_time = cur_datetime
+            logger.debug("New cast in DB: #%d -> %s" % (cur_pk, self._past_cast_time))
+            self._pending_casts.append(rows[-1])
 
-                pre_cur_ssp = self._ssm.db_retrieve_profile(pre_cur_pk)
+        if len(self._pending_casts) == 0:
+            logger.debug("No new cast in DB")
+            return
 
-                self._lock.acquire()
+        if self._has_sis_data:
+            sis_values = (float(self._snapshot.latest("draft")), float(self._snapshot.latest("tss")),
+                          float(self._snapshot.latest("avg_depth")))
+        else:
+            sis_values = None
 
-                if self._has_sis_data:
-                    self._cur_draft = self._drafts[-1]
-                    self._cur_tss = self._tsss[-1]
-                    self._cur_depth = self._depths[-1]
-                else:
-                    self._cur_draft = self._default_draft
-                    self._cur_tss = pre_cur_ssp.cur.interpolate_proc_speed_at_depth(self._default_draft)
-                    self._cur_depth = self._avg_depth
-                self._cur_time = pre_cur_datetime
+        self._lock.acquire()
+        try:
+            cast_time = self._cast_time.copy()
+        finally:
+            self._lock.release()
+
+        self._estimation = self._estimation_worker.submit(
+            self._run_cast_time, cast_time=cast_time, casts=list(self._pending_casts), sis_values=sis_values,
+            default_draft=self._default_draft, avg_depth=self._avg_depth)
+
+    def _run_cast_time(self, cast_time: CastTime, casts: list, sis_values: Optional[tuple], default_draft: float,
+                       avg_depth: float) -> dict:
+        """Update a copy of the CastTime estimator with the passed casts (run by the estimation worker)"""
+        result = {
+            "cast_time": cast_time,
+            "generation": cast_time.generation,
+            "nr_casts": len(casts),
+            "nr_estimated": 0,
+            "updated": False,
+        }
+
+        for cast_datetime, cast_pk in casts:
+            ssp = self._profiles.retrieve(cast_pk)
+            if ssp is None:
+                # e.g., the cast was deleted from the project
+                logger.warning("unable to retrieve cast #%s -> skipped" % cast_pk)
+                continue
 
-                self._cast_time_updated = self._cast_time.update(tss_depth=self._cur_draft,
-                                                                 tss_value=self._cur_tss,
-                                                                 avg_depth=self._cur_depth,
-                                                                 latest_cast_time=self._cur_time,
-                                                                 latest_ssp=pre_cur_ssp)
-                self._lock.release()
+            if sis_values is not None:
+                draft, tss, depth = sis_values
+            else:
+                draft = default_draft
+                tss = ssp.cur.interpolate_proc_speed_at_depth(default_draft)
+                depth = avg_depth
 
-        else:
-            if cur_datetime > self._past_cast_time:
+            result["updated"] = cast_time.update(tss_depth=draft, tss_value=tss, avg_depth=depth,
+                                                 latest_cast_time=cast_datetime, latest_ssp=ssp, latest_pk=cast_pk)
+            result["draft"] = draft
+            result["tss"] = tss
+            result["depth"] = depth
+            result["time"] = cast_datetime
+            result["nr_estimated"] += 1
 
-                self._past_cast_time = cur_datetime
-                logger.debug("New cast in DB: #%d -> %s" % (cur_pk, self._past_cast_time))
+        return result
 
-            else:
+    def _publish_cast_time(self, estimation: Future) -> None:
+        try:
+            result = estimation.result()
 
-                logger.debug("No new cast in DB")
-                return
+        except Exception as e:
+            logger.error("CastTime estimation failed: %s" % e, exc_info=True)
+            # the pending casts are estimated again at the next step
+            self._estimation_failures += 1
+            if self._estimation_failures >= self._max_estimation_failures:
+                logger.error("CastTime estimation failed %d times -> dropping cast: %s"
+                             % (self._estimation_failures, self._pending_casts[:1]))
+                del self._pending_casts[:1]
+                self._estimation_failures = 0
+            return
 
-        cur_ssp = self._ssm.db_retrieve_profile(cur_pk)
+        self._estimation_failures = 0
 
         self._lock.acquire()
+        try:
+            # the estimator was changed (e.g., new settings) during the estimation -> estimate again
+            if self._cast_time.generation != result["generation"]:
+                logger.debug("CastTime changed during the estimation")
+                return
 
-        if self._has_sis_data:
-            self._cur_draft = self._drafts[-1]
-            self._cur_tss = self._tsss[-1]
-            self._cur_depth = self._depths[-1]
-        else:
-            self._cur_draft = self._default_draft
-            self._cur_tss = cur_ssp.cur.interpolate_proc_speed_at_depth(self._default_draft)
-            self._cur_depth = self._avg_depth
-        self._cur_time = cur_datetime
-
-        self._cast_time_updated = self._cast_time.update(tss_depth=self._cur_draft,
-                                                         tss_value=self._cur_tss,
-                                                         avg_depth=self._cur_depth,
-                                                         latest_cast_time=self._cur_time,
-                                                         latest_ssp=cur_ssp)
-        self._next_cast_time = self._cast_time.next_loc_cast_time
-        self._lock.release()
+            # all the casts may have been skipped
+            if result["nr_estimated"] > 0:
+                self._cast_time = result["cast_time"]
+                self._cast_time_updated = result["updated"]
+                self._cur_draft = result["draft"]
+                self._cur_tss = result["tss"]
+                self._cur_depth = result["depth"]
+                self._cur_time = result["time"]
+                self._next_cast_time = self._cast_time.next_loc_cast_time
 
-    def _retrieve_from_sis(self) -> str:
+        finally:
+            self._lock.release()
 
-        msg = str()
+        del self._pending_casts[:result["nr_casts"]]
 
-        # be sure that we have both navigation and depth datagrams
-        if self._ssm.listeners.sis.nav is None:
-            return str()
-        if self._ssm.listeners.sis.nav_timestamp is None:
-            return str()
-        if (self._ssm.listeners.sis.nav_latitude is None) or (self._ssm.listeners.sis.nav_longitude is None):
-            return str()
-        if self._ssm.listeners.sis.xyz is None:
-            return str()
-        if self._ssm.listeners.sis.xyz_transducer_sound_speed is None:
+    @property
+    def estimation_stats(self) -> dict:
+        """Submitted, completed and failed jobs, and durations of the estimation worker"""
+        return self._estimation_worker.stats
+
+    def _retrieve_from_sis(self) -> str:
+        sample = read_sis_sample(self._ssm.listeners.sis)
+        if sample is None:
             return str()
 
         # time stamp
         # - check to avoid to store the latest datagram after SIS is turned off
+        timestamp = sample[0]
         if self._last_dgtime:
-            if self._last_dgtime > self._ssm.listeners.sis.xyz.dg_time:
+            if self._last_dgtime >= timestamp:
                 return str()
-        # - add string
-        timestamp = self._ssm.listeners.sis.xyz.dg_time
         self._last_dgtime = timestamp
-        msg += "%s, " % timestamp.strftime("%H:%M:%S.%f")
+
+        return self._store_sample(*sample)
+
+    def _on_sis_sample(self, timestamp: datetime.datetime, latitude: float, longitude: float, tss: float,
+                       draft: float, depth: float) -> None:
+        """Callback for each SIS sample (called by the listener thread)"""
+        if (not self._active) or self._pause:
+            return
+
+        self._store_sample(timestamp, latitude, longitude, tss, draft, depth)
+        self._count_sis_sample()
+
+    def _count_sis_sample(self) -> None:
+        self._counter_lock.acquire()
+        try:
+            self._has_sis_data = True
+            self._counter += 1
+        finally:
+            self._counter_lock.release()
+
+    def _update_sis_ingest(self) -> None:
+        """Attach the callback ingest to the current SIS listener (or detach it when polling)"""
+        if self._ingest_mode == IngestMode.CALLBACK:
+            if self._sis_ingest.listener is not self._ssm.listeners.sis:
+                if not self._sis_ingest.attach(self._ssm.listeners.sis):
+                    logger.warning("SIS listener without a usable parse hook -> fallback to polling ingest")
+                    self._ingest_mode = IngestMode.POLLING
+        else:
+            self._sis_ingest.detach()
+
+    def _store_sample(self, timestamp: datetime.datetime, latitude: float, longitude: float, tss: float,
+                      draft: float, depth: float) -> str:
+
+        msg = "%s, " % timestamp.strftime("%H:%M:%S.%f")
 
         # position
         # - latitude
-        latitude = self._ssm.listeners.sis.nav_latitude
         if latitude >= 0:
             letter = "N"
         else:
@@ -368,7 +536,6 @@ class SurveyDataMonitor:
         lat_min = float(60 * math.fabs(latitude - int(latitude)))
         lat_str = "%02d\N{DEGREE SIGN}%7.3f'%s" % (int(math.fabs(latitude)), lat_min, letter)
         # - longitude
-        longitude = self._ssm.listeners.sis.nav_longitude
         if longitude < 0:
             letter = "W"
         else:
@@ -379,38 +546,47 @@ class SurveyDataMonitor:
         msg += "(%s, %s), " % (lat_str, lon_str)
 
         # - tss
-        tss = self._ssm.listeners.sis.xyz_transducer_sound_speed
         msg += '%.2f m/s,  ' % tss
         # - draft
-        draft = self._ssm.listeners.sis.xyz_transducer_depth
         msg += '%.1f m, ' % draft
         # - mean depth
-        depth = self._ssm.listeners.sis.xyz_mean_depth
         msg += '%.1f m' % depth
 
-        db = MonitorDb(projects_folder=self.output_folder, base_name=self.base_name)
-        db.add_point(timestamp=timestamp, lat=latitude, long=longitude, tss=tss, draft=draft, avg_depth=depth)
+        decimator = self._decimator
+        if (decimator is not None) and not decimator.accept(timestamp=timestamp, long=longitude, lat=latitude,
+                                                            tss=tss, draft=draft, avg_depth=depth):
+            return msg + ' (decimated)'
 
-        self._lock.acquire()
-
-        self._times.append(timestamp)
-        self._lats.append(latitude)
-        self._longs.append(longitude)
-        self._tsss.append(tss)
-        self._drafts.append(draft)
-        self._depths.append(depth)
-
-        self._data_info += "\nSIS:\n" \
-                           "- Total samples: %d\n" \
-                           "- Timestamp: %s\n" \
-                           "- Position: %.7f, %.7f\n" \
-                           "- Surface sound speed: %.2f m\n" \
-                           "- Transducer draft: %.2f m\n" \
-                           "- Average swath depth: %.2f m\n" \
-                           % (len(self._lats), timestamp.strftime("%d/%m/%y %H:%M:%S.%f"), longitude, latitude, tss,
-                              draft, depth)
+        writer = self._writer
+        if writer is not None:
+            writer.put(timestamp=timestamp, long=longitude, lat=latitude, tss=tss, draft=draft, avg_depth=depth)
+        else:
+            logger.warning("missing session writer -> sample not stored: %s" % timestamp)
 
-        self._lock.release()
+        self._samples_lock.acquire()
+        try:
+            self._samples.append(timestamp=timestamp, long=longitude, lat=latitude, tss=tss, draft=draft,
+                                 avg_depth=depth)
+            self._publish_snapshot()
+        finally:
+            self._samples_lock.release()
+
+        sis_info = "\nSIS:\n" \
+                   "- Total samples: %d\n" \
+                   "- Timestamp: %s\n" \
+                   "- Position: %.7f, %.7f\n" \
+                   "- Surface sound speed: %.2f m\n" \
+                   "- Transducer draft: %.2f m\n" \
+                   "- Average swath depth: %.2f m\n" \
+                   % (len(self._snapshot), timestamp.strftime("%d/%m/%y %H:%M:%S.%f"), longitude, latitude, tss,
+                      draft, depth)
+        if writer is not None:
+            writer_stats = writer.stats
+            sis_info += "- Storage queue: %d (dropped: %d, last flush: %.3f s)\n" \
+                        % (writer_stats["queue_depth"], writer_stats["dropped"], writer_stats["last_flush_latency"])
+        if decimator is not None:
+            sis_info += "- Decimated samples: %d\n" % decimator.nr_rejected
+        self._sis_info = sis_info
 
         return msg
 
@@ -418,6 +594,8 @@ class SurveyDataMonitor:
         if self._pause:
             logger.debug("Resume monitoring")
             self._pause = False
+            if self._scheduler is not None:
+                self._scheduler.resume()
             return
 
         if clear_data:
@@ -428,69 +606,147 @@ class SurveyDataMonitor:
             if self.base_name is None:
                 self.base_name = self._ssm.current_project + "_" + datetime.datetime.now().strftime("%d%m%Y_%H%M%S")
 
+        self._start_writer()
+
         self._active = True
         self._pause = False
         logger.debug("Start monitoring")
 
-        try:
-            self.monitoring()
-        except Exception as e:
-            traceback.print_exc()
-            logger.warning("monitoring issue: %s" % e)
+        self._stop_scheduler()
+        self._scheduler = FixedRateScheduler(task=self.monitoring, period=self._timing, name="SurveyDataMonitor")
+        self._scheduler.start()
 
     def clear_data(self) -> None:
-        self._times.clear()
-        self._lats.clear()
-        self._longs.clear()
-        self._tsss.clear()
-        self._drafts.clear()
-        self._depths.clear()
+        self._samples_lock.acquire()
+        try:
+            self._samples.clear()
+            self._publish_snapshot()
+        finally:
+            self._samples_lock.release()
         self._data_info = str()
+        self._sis_info = str()
         self._counter = 0
+        if self._decimator is not None:
+            self._decimator.reset()
         self.base_name = None
 
     def pause_monitor(self) -> None:
         self._active = True
         self._pause = True
+        if self._scheduler is not None:
+            self._scheduler.pause()
 
     def stop_monitor(self) -> None:
         self._active = False
         self._pause = False
+        logger.debug("Stop monitoring")
+        self._stop_scheduler()
+        self._sis_ingest.detach()
+        self._stop_writer()
+        # a running estimation is discarded (its casts are estimated again at the next start)
+        self._estimation_worker.shutdown()
+        self._estimation = None
+        self._casts.close()
+        self._cast_index.close()
+
+    def _stop_scheduler(self) -> None:
+        scheduler = self._scheduler
+        if scheduler is None:
+            return
 
-    def nr_of_samples(self) -> int:
-        self._lock.acquire()
-        nr = len(self._times)
-        self._lock.release()
-        return nr
+        self._scheduler = None
+        if not scheduler.stop(timeout=self._scheduler_stop_timeout):
+            logger.warning("monitoring still running: %s" % scheduler.stats)
 
-    def find_next_idx_in_time(self, ts: datetime.datetime) -> int:
-        time_idx = len(self._times) - 1
-        for _idx, _time in enumerate(self._times):
-            if ts < _time:
-                return _idx
-        return time_idx
+    @property
+    def scheduler_stats(self) -> Optional[dict]:
+        """Ticks, overruns and errors of the monitoring scheduler (None when not monitoring)"""
+        scheduler = self._scheduler
+        if scheduler is None:
+            return None
+        return scheduler.stats
+
+    def _start_writer(self) -> None:
+        self._stop_writer()
+        self._writer = DbWriter(projects_folder=self.output_folder, base_name=self.base_name)
+        self._writer.start()
+
+    def _stop_writer(self) -> None:
+        writer = self._writer
+        if writer is None:
+            return
 
-    def lonlat_casts(self, min_time: datetime.datetime, max_time: datetime.datetime) -> tuple:
+        self._writer = None
+        if not writer.stop(timeout=self._writer_stop_timeout):
+            logger.warning("session writer not flushed: %s" % writer.stats)
 
-        rows = self._ssm.db_timestamp_list()
-        nr_rows = len(rows)
-        if nr_rows == 0:
-            logger.debug("The database is empty")
-            return list(), list()
+    @property
+    def writer_stats(self) -> Optional[dict]:
+        """Queue depth, flush latency and drop counters of the session writer (None when not monitoring)"""
+        writer = self._writer
+        if writer is None:
+            return None
+        return writer.stats
 
-        lons = list()
-        lats = list()
+    @property
+    def profile_cache_stats(self) -> dict:
+        """Size, hits and misses of the cache of the SSM profiles"""
+        return self._profiles.stats
 
-        for row in rows:
-            cur_datetime = row[0]
-            if (cur_datetime < min_time) or (cur_datetime > max_time):
-                continue
+    def nr_of_samples(self) -> int:
+        return len(self._snapshot)
+
+    def samples_between(self, t0: Optional[datetime.datetime] = None,
+                        t1: Optional[datetime.datetime] = None) -> dict:
+        """Return the samples in the [t0, t1] time range as a dict of NumPy arrays (copies)
+
+        The samples no more retained in memory are read back from the session db.
+        """
+        snapshot = self._snapshot
+        times = snapshot.column("time")
+        idx0 = 0
+        if t0 is not None:
+            idx0 = int(np.searchsorted(times, SampleStore.to_datetime64(t0), side="left"))
+        idx1 = len(times)
+        if t1 is not None:
+            idx1 = int(np.searchsorted(times, SampleStore.to_datetime64(t1), side="right"))
+        samples = dict()
+        for column in SampleStore.columns:
+            samples[column] = snapshot.column(column)[idx0:idx1].copy()
+
+        oldest_time = None
+        if len(times) > 0:
+            oldest_time = times[0]
+        read_db = (snapshot.nr_discarded > 0) and \
+                  ((t0 is None) or (oldest_time is None) or (SampleStore.to_datetime64(t0) < oldest_time))
+
+        if not read_db or (self.base_name is None):
+            return samples
+
+        db_t1 = t1
+        if oldest_time is not None:
+            db_t1 = oldest_time - np.timedelta64(1, "us")
+            if (t1 is not None) and (SampleStore.to_datetime64(t1) < db_t1):
+                db_t1 = t1
+        db = MonitorDb(projects_folder=self.output_folder, base_name=self.base_name)
+        points = db.points_between(t0=t0, t1=db_t1, columns=SampleStore.columns)
+        db.close()
+        if points is None:
+            logger.warning("unable to read back samples from: %s" % db.db_path)
+            return samples
 
-            cur_pk = row[1]
-            cur_ssp = self._ssm.db_retrieve_profile(cur_pk)
-            lons.append(cur_ssp.cur.meta.longitude)
-            lats.append(cur_ssp.cur.meta.latitude)
+        logger.debug("read back from session db: %d samples" % len(points["time"]))
+        for column in SampleStore.columns:
+            samples[column] = np.concatenate((points[column], samples[column]))
+        return samples
+
+    def find_next_idx_in_time(self, ts: datetime.datetime) -> int:
+        return int(np.searchsorted(self._snapshot.column("time"), SampleStore.to_datetime64(ts), side="right"))
 
+    def lonlat_casts(self, min_time: datetime.datetime, max_time: datetime.datetime) -> tuple:
+        lons, lats = self._cast_index.lonlat_between(min_time=min_time, max_time=max_time)
+        if len(self._cast_index) == 0:
+            logger.debug("The database is empty")
         return lons, lats
 
     def add_kongsberg_data(self, filenames: list) -> None:
@@ -500,7 +756,7 @@ class SurveyDataMonitor:
             if not os.path.exists(filename):
                 raise RuntimeError("The passed db to merge does not exist")
 
-            kng = EmSeries(file_input=filename)
+            kng = EmSeries(file_input=filename, decimator=self._decimator)
             logger.debug(kng)
 
             output_folder = os.path.abspath(os.path.dirname(filename))
@@ -513,106 +769,65 @@ class SurveyDataMonitor:
             logger.debug("output db: %s" % output_db)
 
             input_times = kng.timestamps
-            output_times, _ = output_db.timestamp_list()
-
-            for idx, input_time in enumerate(input_times):
-
-                if input_time in output_times:
 
-                    logger.debug("An entry with the same timestamp is in the output db! -> Skipping entry import")
-
-                else:
-
-                    success = output_db.add_point(timestamp=kng.timestamps[idx],
-                                                  lat=kng.lats[idx],
-                                                  long=kng.longs[idx],
-                                                  tss=kng.tsss[idx],
-                                                  draft=kng.drafts[idx],
-                                                  avg_depth=kng.avg_depths[idx])
-                    if not success:
-                        logger.warning("issue in importing point with timestamp: %s" % input_time)
-
-                # insert the new data in chronological order
-                self._lock.acquire()
-
-                if input_time not in self._times:
-                    insert_idx = self.find_next_idx_in_time(input_time)
-
-                    try:
-                        self._times.insert(insert_idx, kng.timestamps[insert_idx])
-                        self._lats.insert(insert_idx, kng.lats[insert_idx])
-                        self._longs.insert(insert_idx, kng.longs[insert_idx])
-                        self._tsss.insert(insert_idx, kng.tsss[insert_idx])
-                        self._drafts.insert(insert_idx, kng.drafts[insert_idx])
-                        self._depths.insert(insert_idx, kng.avg_depths[insert_idx])
-
-                    except IndexError:
-                        logger.error("invalid index: %d, length: %d" % (insert_idx, len(self._times)))
-
-                self._lock.release()
+            # the entries with the same timestamp already in the output db are skipped by the db
+            ret = output_db.add_points(timestamps=kng.timestamps, longs=kng.longs, lats=kng.lats, tsss=kng.tsss,
+                                       drafts=kng.drafts, avg_depths=kng.avg_depths)
+            if ret is None:
+                logger.warning("issue in importing %d points from: %s" % (len(input_times), filename))
+            else:
+                logger.debug("imported points -> inserted: %d, skipped: %d" % ret)
+
+            # merge the new data in chronological order
+            self._samples_lock.acquire()
+            try:
+                nr_merged = self._samples.merge(timestamps=input_times, longs=kng.longs, lats=kng.lats,
+                                                tsss=kng.tsss, drafts=kng.drafts, avg_depths=kng.avg_depths)
+                self._publish_snapshot()
+            finally:
+                self._samples_lock.release()
+            logger.debug("merged samples: %d" % nr_merged)
 
     def add_db_data(self, filenames: list) -> None:
 
         for filename in filenames:
-
             if not os.path.exists(filename):
                 raise RuntimeError("The passed db to merge does not exist")
 
-            output_folder = os.path.abspath(os.path.dirname(filename))
-            basename = os.path.splitext(os.path.basename(filename))[0]
-            logger.debug("db: %s, %s" % (output_folder, basename))
-
-            if self.base_name is None:
-                self.base_name = basename
+        if self.base_name is None:
+            self.base_name = os.path.splitext(os.path.basename(filenames[0]))[0]
 
-            load_in_db = True
+        output_db = MonitorDb(projects_folder=self.output_folder, base_name=self.base_name)
+        logger.debug("output db: %s" % output_db.db_path)
 
-            if (output_folder == self.output_folder) and (basename == self.base_name):
-                logger.debug("Input and output are the same! -> Just loading data")
-                load_in_db = False
-            # print(output_folder, self.output_folder, basename, self.base_name)
+        # the input dbs are merged in a single pass (the output db itself, if selected, is just loaded)
+        stats = output_db.merge_dbs(db_paths=filenames)
+        if len(stats["failed_dbs"]) > 0:
+            logger.warning("unable to merge: %s" % ", ".join(stats["failed_dbs"]))
 
-            input_db = MonitorDb(projects_folder=output_folder, base_name=basename)
-            # logger.debug("input db: %s" % input_db)
-
-            output_db = None
-            if load_in_db:
-                output_db = MonitorDb(projects_folder=self.output_folder, base_name=self.base_name)
-                # logger.debug("output db: %s" % output_db)
-                output_times, _ = output_db.timestamp_list()
-            else:
-                output_times = list()
-
-            input_times, input_ids = input_db.timestamp_list()
-            if len(input_times) == 0:
-                logger.info("Input db is empty! -> Skipping db file")
-                continue
-
-            for idx, input_time in enumerate(input_times):
-
-                if input_time in output_times:
-                    logger.debug("An entry with the same timestamp is in the output db! -> Skipping entry import")
-                    continue
-
-                timestamp, long, lat, tss, draft, avg_depth = input_db.point_by_id(input_ids[idx])
-                if load_in_db:
-                    success = output_db.add_point(timestamp=timestamp, lat=lat, long=long, tss=tss,
-                                                  draft=draft, avg_depth=avg_depth)
-                    if not success:
-                        logger.warning("issue in importing point with timestamp: %s" % input_time)
-
-                # insert the new data in chronological order
-                self._lock.acquire()
-
-                insert_idx = self.find_next_idx_in_time(input_time)
-                self._times.insert(insert_idx, timestamp)
-                self._lats.insert(insert_idx, lat)
-                self._longs.insert(insert_idx, long)
-                self._tsss.insert(insert_idx, tss)
-                self._drafts.insert(insert_idx, draft)
-                self._depths.insert(insert_idx, avg_depth)
-
-                self._lock.release()
+        # the session is streamed in chronological batches: the retention is enforced at each batch, so the
+        # memory used does not depend on the session size
+        nr_read = 0
+        nr_merged = 0
+        try:
+            for points in output_db.iter_points(batch_size=self._read_back_batch_size,
+                                                columns=SampleStore.columns):
+                nr_read += len(points["time"])
+                self._samples_lock.acquire()
+                try:
+                    nr_merged += self._samples.merge(timestamps=points["time"], longs=points["long"],
+                                                     lats=points["lat"], tsss=points["tss"],
+                                                     drafts=points["draft"], avg_depths=points["avg_depth"])
+                    self._publish_snapshot()
+                finally:
+                    self._samples_lock.release()
+        finally:
+            output_db.close()
+
+        if nr_read == 0:
+            logger.info("Output db is empty! -> Nothing to load")
+            return
+        logger.debug("merged samples: %d" % nr_merged)
 
     def export_surface_speed_points_shapefile(self) -> None:
         db = MonitorDb(projects_folder=self.output_folder, base_name=self.base_name)
@@ -2,19 +2,26 @@ import logging
 import os
 import statistics
 from datetime import datetime, timezone
+from typing import Optional
 
 import numpy as np
 
+from hyo2.sdm4.lib.decimate import Decimator, TimeDecimator
+
 logger = logging.getLogger(__name__)
 
 
 class EmSeries:
     """Class that provides an interface to a SQLite db with Sound Speed data"""
 
-    def __init__(self, file_input: str) -> None:
+    def __init__(self, file_input: str, decimator: Optional[Decimator] = None) -> None:
         if not os.path.exists(file_input):
             raise RuntimeError("The passed data file does not exist: %s" % file_input)
         self._file_input: str = file_input
+        # by default, the output is decimated up to a sample each 3 seconds
+        if decimator is None:
+            decimator = TimeDecimator(step=3.0)
+        self._decimator = decimator
 
         self._pos_timestamps = None
         self._pos_lats = None
@@ -118,22 +125,21 @@ class EmSeries:
         fit_longs = np.polyfit(self._pos_timestamps, self._pos_longs, 1)
         line_longs = np.poly1d(fit_longs)
 
-        latest_xyz_timestamp = None
+        xyz_timestamps = np.asarray(self._xyz_timestamps, dtype=np.float64)
+        xyz_lats = line_lats(xyz_timestamps)
+        xyz_longs = line_longs(xyz_timestamps)
 
-        for xyz_idx, xyz_timestamp in enumerate(self._xyz_timestamps):
+        # decimate the output with the selected policy
+        keep = self._decimator.mask(timestamps=(xyz_timestamps * 1e6).astype("datetime64[us]"), longs=xyz_longs,
+                                    lats=xyz_lats, tsss=self._xyz_tsss, drafts=self._xyz_drafts,
+                                    avg_depths=self._xyz_avg_depths)
 
-            # decimate output up to a sample each 3 seconds
-            if latest_xyz_timestamp is not None:
-                if (xyz_timestamp - latest_xyz_timestamp) < 3:
-                    continue
-                else:
-                    latest_xyz_timestamp = xyz_timestamp
-            else:
-                latest_xyz_timestamp = xyz_timestamp
+        for xyz_idx in np.flatnonzero(keep):
+            xyz_timestamp = self._xyz_timestamps[xyz_idx]
 
             self._timestamps.append(datetime.fromtimestamp(xyz_timestamp, tz=timezone.utc))
-            self._lats.append(line_lats(xyz_timestamp))
-            self._longs.append(line_longs(xyz_timestamp))
+            self._lats.append(xyz_lats[xyz_idx])
+            self._longs.append(xyz_longs[xyz_idx])
 
             self._tsss.append(self._xyz_tsss[xyz_idx])
             self._drafts.append(self._xyz_drafts[xyz_idx])
@@ -150,6 +156,7 @@ class EmSeries:
         if self._xyz_timestamps:
             msg += "  <xyz samples: %d>\n" % len(self._xyz_timestamps)
 
+        msg += "  <decimator: %s>\n" % self._decimator.__class__.__name__
         msg += "  <interpolated samples: %d>\n" % len(self._timestamps)
 
         return msg
@@ -0,0 +1,408 @@
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class SampleSnapshot:
+    """Immutable view of the samples in a SampleStore at a given version"""
+
+    def __init__(self, version: int, columns: dict, nr_discarded: Optional[int] = 0, generation: Optional[int] = 0,
+                 generation_seq: Optional[int] = 0, last_seq: Optional[int] = 0,
+                 discarded_seq: Optional[int] = 0) -> None:
+        self._version = version
+        self._columns = columns
+        self._nr_discarded = nr_discarded
+        self._generation = generation
+        self._generation_seq = generation_seq
+        self._last_seq = last_seq
+        self._discarded_seq = discarded_seq
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    @property
+    def last_seq(self) -> int:
+        return self._last_seq
+
+    @property
+    def nr_discarded(self) -> int:
+        """Number of samples discarded by the retention policy of the store"""
+        return self._nr_discarded
+
+    def __len__(self) -> int:
+        return len(self._columns["time"])
+
+    def column(self, name: str) -> np.ndarray:
+        if name not in self._columns:
+            raise RuntimeError("not passed a valid column: %s" % name)
+        return self._columns[name]
+
+    def latest(self, name: str):
+        """Return the latest value of a column (None if the snapshot is empty)"""
+        if len(self) == 0:
+            return None
+        return self.column(name)[-1]
+
+    def samples_since(self, seq: int, generation: Optional[int] = None) -> dict:
+        """Return the samples added after the passed sequence number (in chronological order)
+
+        The returned dict has:
+        - generation, seq: to be passed to the next call
+        - reset: the store was cleared after the passed generation (the samples are all the current ones)
+        - gap: some samples added after the passed sequence number were discarded before being retrieved
+        - samples: dict of NumPy arrays with the new samples
+        """
+        reset = (generation is not None) and (generation != self._generation)
+        if reset:
+            seq = self._generation_seq
+
+        if seq >= self._last_seq:
+            mask = np.zeros(len(self), dtype=bool)
+        else:
+            mask = self._columns["seq"] > seq
+        samples = dict()
+        for column in SampleStore.columns:
+            samples[column] = self._columns[column][mask]
+
+        return {
+            "generation": self._generation,
+            "seq": self._last_seq,
+            "reset": reset,
+            "gap": seq < self._discarded_seq,
+            "samples": samples,
+        }
+
+    def __repr__(self) -> str:
+        msg = "<%s>\n" % self.__class__.__name__
+
+        msg += "  <generation: %d>\n" % self._generation
+        msg += "  <version: %d>\n" % self._version
+        msg += "  <size: %d>\n" % len(self)
+
+        return msg
+
+
+class SampleStore:
+    """Columnar, NumPy-backed store of the monitored samples
+
+    The samples are kept in chronological order in pre-allocated arrays that grow geometrically, so that
+    appending is amortized O(1). Times are stored as UTC datetime64[us], all the other columns as float64.
+    The retention can be bounded by number of samples (max size) and/or by time span from the latest sample
+    (max span): the oldest samples are then discarded to make room for the new ones.
+
+    The stored samples are never modified in place (appends write after them, the other changes create new
+    buffers), so the views and snapshots returned stay valid while the store keeps changing.
+
+    Each added sample gets a monotonically increasing sequence number (the 'seq' column), and the generation
+    is incremented by each clear: together, they let the consumers retrieve only the new samples.
+    """
+
+    columns = ("time", "long", "lat", "tss", "draft", "avg_depth")
+    time_dtype = np.dtype("datetime64[us]")
+
+    def __init__(self, initial_capacity: Optional[int] = 1024, max_size: Optional[int] = None,
+                 max_span: Optional[timedelta] = None) -> None:
+        if initial_capacity < 1:
+            raise RuntimeError("invalid initial capacity: %s" % initial_capacity)
+        if (max_size is not None) and (max_size < 1):
+            raise RuntimeError("invalid max size: %s" % max_size)
+        if (max_span is not None) and (max_span <= timedelta(0)):
+            raise RuntimeError("invalid max span: %s" % max_span)
+
+        self._initial_capacity = initial_capacity
+        self._max_size = max_size
+        self._max_span = max_span
+        self._start = 0
+        self._end = 0
+        self._nr_discarded = 0
+        self._version = 0
+        self._generation = 0
+        self._generation_seq = 0
+        self._last_seq = 0
+        self._discarded_seq = 0
+        self._data = self._allocate(initial_capacity)
+
+    @classmethod
+    def _allocate(cls, capacity: int) -> dict:
+        data = dict()
+        for column in cls.columns:
+            if column == "time":
+                data[column] = np.empty(capacity, dtype=cls.time_dtype)
+            else:
+                data[column] = np.empty(capacity, dtype=np.float64)
+        data["seq"] = np.empty(capacity, dtype=np.int64)
+        return data
+
+    @classmethod
+    def to_datetime64(cls, timestamp) -> np.datetime64:
+        """Convert a (naive UTC or aware) datetime to UTC datetime64[us]"""
+        if isinstance(timestamp, datetime) and (timestamp.tzinfo is not None):
+            timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+        return np.datetime64(timestamp, "us")
+
+    @classmethod
+    def to_datetime64_array(cls, timestamps) -> np.ndarray:
+        """Convert a sequence of (naive UTC or aware) datetimes, or a datetime64 array, to UTC datetime64[us]"""
+        if isinstance(timestamps, np.ndarray) and np.issubdtype(timestamps.dtype, np.datetime64):
+            return timestamps.astype(cls.time_dtype)
+        return np.fromiter((cls.to_datetime64(timestamp) for timestamp in timestamps), dtype=cls.time_dtype,
+                           count=len(timestamps))
+
+    # --- size and capacity
+
+    def __len__(self) -> int:
+        return self._end - self._start
+
+    @property
+    def capacity(self) -> int:
+        return len(self._data["time"])
+
+    @property
+    def max_size(self) -> Optional[int]:
+        return self._max_size
+
+    @max_size.setter
+    def max_size(self, value: Optional[int]) -> None:
+        if (value is not None) and (value < 1):
+            raise RuntimeError("invalid max size: %s" % value)
+        self._max_size = value
+        self._enforce_retention()
+
+    @property
+    def max_span(self) -> Optional[timedelta]:
+        return self._max_span
+
+    @max_span.setter
+    def max_span(self, value: Optional[timedelta]) -> None:
+        if (value is not None) and (value <= timedelta(0)):
+            raise RuntimeError("invalid max span: %s" % value)
+        self._max_span = value
+        self._enforce_retention()
+
+    @property
+    def nr_discarded(self) -> int:
+        """Number of samples discarded by the retention policy since the last clear"""
+        return self._nr_discarded
+
+    @property
+    def version(self) -> int:
+        """Counter incremented at each change of the stored samples"""
+        return self._version
+
+    @property
+    def generation(self) -> int:
+        """Counter incremented at each clear of the store"""
+        return self._generation
+
+    @property
+    def last_seq(self) -> int:
+        """Sequence number of the latest added sample"""
+        return self._last_seq
+
+    @property
+    def nbytes(self) -> int:
+        return sum(array.nbytes for array in self._data.values())
+
+    def _reserve(self, nr_samples: int) -> None:
+        """Make room at the end of the buffers for the passed number of samples"""
+        if self._end + nr_samples <= self.capacity:
+            return
+
+        # the retained samples are moved to new buffers (dropping the discarded ones at the front): they are
+        # never compacted in place since there may be views on them
+        size = len(self)
+        new_capacity = self.capacity
+        if size + nr_samples > new_capacity // 2:
+            new_capacity *= 2
+            while size + nr_samples > new_capacity:
+                new_capacity *= 2
+        data = self._allocate(new_capacity)
+        for column, array in self._data.items():
+            data[column][:size] = array[self._start:self._end]
+        self._data = data
+
+        self._start = 0
+        self._end = size
+
+    def _enforce_retention(self) -> None:
+        nr_extra = 0
+
+        if self._max_size is not None:
+            nr_extra = max(nr_extra, len(self) - self._max_size)
+
+        if (self._max_span is not None) and (len(self) > 0):
+            times = self._data["time"][self._start:self._end]
+            cutoff = times[-1] - np.timedelta64(self._max_span)
+            nr_extra = max(nr_extra, int(np.searchsorted(times, cutoff, side="left")))
+
+        if nr_extra > 0:
+            self._discarded_seq = max(self._discarded_seq,
+                                      int(self._data["seq"][self._start:self._start + nr_extra].max()))
+            self._start += nr_extra
+            self._nr_discarded += nr_extra
+            self._version += 1
+
+    # --- writing
+
+    def append(self, timestamp, long: float, lat: float, tss: float, draft: float, avg_depth: float) -> None:
+        self._reserve(1)
+        self._data["time"][self._end] = self.to_datetime64(timestamp)
+        self._data["long"][self._end] = long
+        self._data["lat"][self._end] = lat
+        self._data["tss"][self._end] = tss
+        self._data["draft"][self._end] = draft
+        self._data["avg_depth"][self._end] = avg_depth
+        self._last_seq += 1
+        self._data["seq"][self._end] = self._last_seq
+        self._end += 1
+        self._version += 1
+        self._enforce_retention()
+
+    def insert(self, idx: int, timestamp, long: float, lat: float, tss: float, draft: float,
+               avg_depth: float) -> None:
+        """Insert a sample at the passed position (that must keep the chronological order)"""
+        size = len(self)
+        if (idx < 0) or (idx > size):
+            raise RuntimeError("invalid index: %d, length: %d" % (idx, size))
+
+        self._last_seq += 1
+        values = {"time": self.to_datetime64(timestamp), "long": long, "lat": lat, "tss": tss, "draft": draft,
+                  "avg_depth": avg_depth, "seq": self._last_seq}
+        capacity = self.capacity
+        if size + 1 > capacity:
+            capacity *= 2
+        data = self._allocate(capacity)
+        for column, array in self._data.items():
+            data[column][:idx] = array[self._start:self._start + idx]
+            data[column][idx] = values[column]
+            data[column][idx + 1:size + 1] = array[self._start + idx:self._end]
+        self._data = data
+        self._start = 0
+        self._end = size + 1
+        self._version += 1
+        self._enforce_retention()
+
+    def merge(self, timestamps, longs, lats, tsss, drafts, avg_depths) -> int:
+        """Merge a batch of samples (in any order) keeping the chronological order, return the number of new samples
+
+        The samples with a time already in the store (or repeated in the batch) are skipped. The batch is sorted
+        once and merged in a single pass, so the cost is O(n + m log m) rather than one shift per sample.
+        """
+        times = self.to_datetime64_array(timestamps)
+        values = {"long": longs, "lat": lats, "tss": tsss, "draft": drafts, "avg_depth": avg_depths}
+        for column in values.keys():
+            values[column] = np.asarray(values[column], dtype=np.float64)
+            if len(values[column]) != len(times):
+                raise RuntimeError("invalid length for %s: %d (expected: %d)"
+                                   % (column, len(values[column]), len(times)))
+        if len(times) == 0:
+            return 0
+
+        # sort the batch and remove the repeated times
+        order = np.argsort(times, kind="stable")
+        times = times[order]
+        keep = np.ones(len(times), dtype=bool)
+        keep[1:] = times[1:] != times[:-1]
+
+        # remove the times already in the store (binary search)
+        existing = self.column("time")
+        idxs = np.searchsorted(existing, times, side="left")
+        found = idxs < len(existing)
+        keep[found] &= existing[idxs[found]] != times[found]
+
+        times = times[keep]
+        nr_new = len(times)
+        if nr_new == 0:
+            return 0
+        values["time"] = times
+        for column in values.keys():
+            if column != "time":
+                values[column] = values[column][order][keep]
+        values["seq"] = np.arange(self._last_seq + 1, self._last_seq + nr_new + 1, dtype=np.int64)
+        self._last_seq += nr_new
+
+        size = len(self)
+        if (size == 0) or (times[0] > existing[-1]):
+            # fast path: the batch is newer than the stored samples
+            self._reserve(nr_new)
+            for column, array in self._data.items():
+                array[self._end:self._end + nr_new] = values[column]
+
+        else:
+            positions = np.searchsorted(existing, times, side="right")
+            capacity = self.capacity
+            while size + nr_new > capacity:
+                capacity *= 2
+            data = self._allocate(capacity)
+            for column in data.keys():
+                data[column][:size + nr_new] = np.insert(self._data[column][self._start:self._end], positions,
+                                                         values[column])
+            self._data = data
+            self._start = 0
+            self._end = size
+
+        self._end += nr_new
+        self._version += 1
+        self._enforce_retention()
+        return nr_new
+
+    def clear(self) -> None:
+        self._start = 0
+        self._end = 0
+        self._nr_discarded = 0
+        self._discarded_seq = self._last_seq
+        self._generation += 1
+        self._generation_seq = self._last_seq
+        self._version += 1
+        # new buffers, since there may be views on the old ones
+        self._data = self._allocate(self._initial_capacity)
+
+    # --- reading
+
+    def column(self, name: str) -> np.ndarray:
+        """Return a zero-copy, read-only view of a column"""
+        if name not in self._data:
+            raise RuntimeError("not passed a valid column: %s" % name)
+
+        view = self._data[name][self._start:self._end].view()
+        view.flags.writeable = False
+        return view
+
+    def snapshot(self) -> SampleSnapshot:
+        """Return an immutable (zero-copy) snapshot of the current samples"""
+        return SampleSnapshot(version=self._version,
+                              columns={column: self.column(column) for column in self._data.keys()},
+                              nr_discarded=self._nr_discarded, generation=self._generation,
+                              generation_seq=self._generation_seq, last_seq=self._last_seq,
+                              discarded_seq=self._discarded_seq)
+
+    def latest(self, name: str):
+        """Return the latest value of a column (None if the store is empty)"""
+        if len(self) == 0:
+            return None
+        return self.column(name)[-1]
+
+    def searchsorted(self, timestamp, side: Optional[str] = "right") -> int:
+        return int(np.searchsorted(self.column("time"), self.to_datetime64(timestamp), side=side))
+
+    def contains(self, timestamp) -> bool:
+        idx = self.searchsorted(timestamp, side="left")
+        return (idx < len(self)) and (self._data["time"][self._start + idx] == self.to_datetime64(timestamp))
+
+    def __repr__(self) -> str:
+        msg = "<%s>\n" % self.__class__.__name__
+
+        msg += "  <size: %d>\n" % len(self)
+        msg += "  <capacity: %d>\n" % self.capacity
+        msg += "  <max size: %s>\n" % self._max_size
+
+        return msg
@@ -0,0 +1,140 @@
+import logging
+import time
+import traceback
+from threading import Thread, Event, Lock, current_thread
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class FixedRateScheduler:
+    """Run a task at a fixed rate in a single, long-lived thread
+
+    The ticks are scheduled on absolute (monotonic) times, so the period does not drift with the task duration.
+    When a run takes longer than the period, the missed ticks are skipped and accounted as overruns.
+    An exception raised by the task is logged and does not stop the scheduling.
+
+    The clock and the wait between the ticks can be replaced (e.g., to drive the scheduler with a simulated time).
+    The wait must return as soon as the scheduler is stopped.
+    """
+
+    def __init__(self, task: Callable[[], None], period: float, name: Optional[str] = "FixedRateScheduler",
+                 clock: Optional[Callable[[], float]] = None,
+                 wait: Optional[Callable[[float], object]] = None) -> None:
+        if period <= 0.0:
+            raise RuntimeError("invalid period: %s" % period)
+
+        self._task = task
+        self._period = period
+        self._name = name
+
+        self._thread = None  # type: Optional[Thread]
+        self._stop_event = Event()
+        self._clock = clock if clock is not None else time.monotonic
+        self._wait = wait if wait is not None else self._stop_event.wait
+        self._paused = False
+        self._stats_lock = Lock()
+
+        self._ticks = 0
+        self._runs = 0
+        self._overruns = 0
+        self._skipped_ticks = 0
+        self._errors = 0
+        self._last_duration = 0.0
+        self._max_duration = 0.0
+
+    @property
+    def period(self) -> float:
+        return self._period
+
+    @property
+    def running(self) -> bool:
+        return (self._thread is not None) and self._thread.is_alive()
+
+    @property
+    def paused(self) -> bool:
+        return self._paused
+
+    def start(self) -> None:
+        if self.running:
+            logger.debug("%s already running" % self._name)
+            return
+
+        self._stop_event.clear()
+        self._paused = False
+        self._thread = Thread(target=self._run, name=self._name, daemon=True)
+        self._thread.start()
+
+    def pause(self) -> None:
+        """The thread keeps ticking, but the task is not run"""
+        self._paused = True
+
+    def resume(self) -> None:
+        self._paused = False
+
+    def stop(self, timeout: Optional[float] = None) -> bool:
+        """Stop the scheduling (after the running task, if any), return False if not stopped within the timeout"""
+        self._stop_event.set()
+        thread = self._thread
+        if (thread is None) or (thread is current_thread()):
+            return True
+
+        thread.join(timeout=timeout)
+        if thread.is_alive():
+            logger.warning("%s not stopped after %s s" % (self._name, timeout))
+            return False
+
+        return True
+
+    def _run(self) -> None:
+        logger.debug("%s started: every %.3f s" % (self._name, self._period))
+        next_time = self._clock()
+
+        while not self._stop_event.is_set():
+
+            if not self._paused:
+                start = self._clock()
+                try:
+                    self._task()
+
+                except Exception as e:
+                    traceback.print_exc()
+                    logger.warning("%s task issue: %s" % (self._name, e))
+                    with self._stats_lock:
+                        self._errors += 1
+
+                duration = self._clock() - start
+                with self._stats_lock:
+                    self._runs += 1
+                    self._last_duration = duration
+                    self._max_duration = max(self._max_duration, duration)
+
+            with self._stats_lock:
+                self._ticks += 1
+
+            next_time += self._period
+            now = self._clock()
+            if now > next_time:
+                # skip the missed ticks, but keep the phase
+                nr_missed = int((now - next_time) / self._period) + 1
+                next_time += nr_missed * self._period
+                with self._stats_lock:
+                    self._overruns += 1
+                    self._skipped_ticks += nr_missed
+
+            self._wait(next_time - now)
+
+        logger.debug("%s stopped: %s" % (self._name, self.stats))
+
+    @property
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                "ticks": self._ticks,
+                "runs": self._runs,
+                "overruns": self._overruns,
+                "skipped_ticks": self._skipped_ticks,
+                "errors": self._errors,
+                "last_duration": self._last_duration,
+                "max_duration": self._max_duration,
+            }
@@ -0,0 +1,175 @@
+import logging
+import time
+from queue import Queue, Empty, Full
+from threading import Thread, Event, Lock
+from typing import Optional
+
+from hyo2.sdm4.lib.db import MonitorDb
+
+logger = logging.getLogger(__name__)
+
+
+class DbWriter(Thread):
+    """Background thread that stores the monitored samples in a MonitorDb
+
+    The samples are queued by the monitoring loop (never blocking it) and written in batches, so that
+    the storage latency does not affect the ingest cadence. When the queue is full, or when the writer is not running
+    (stopped, or unable to open the db), the new samples are dropped.
+    """
+
+    def __init__(self, projects_folder: str, base_name: str, max_queue_size: Optional[int] = 10000,
+                 batch_size: Optional[int] = 1000, flush_interval: Optional[float] = 0.5) -> None:
+        super().__init__(name="DbWriter", daemon=True)
+        self.projects_folder = projects_folder
+        self.base_name = base_name
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self._queue = Queue(maxsize=max_queue_size)
+        self._stop_event = Event()
+        self._stats_lock = Lock()
+        self._open_error = None  # type: Optional[str]
+        self._drop_reason = None  # type: Optional[str]
+
+        self._written = 0
+        self._skipped = 0
+        self._dropped = 0
+        self._failed = 0
+        self._flushes = 0
+        self._last_flush_latency = 0.0
+        self._max_flush_latency = 0.0
+        self._total_flush_latency = 0.0
+
+    def put(self, timestamp, long: float, lat: float, tss: float, draft: float, avg_depth: float) -> bool:
+        """Queue a sample to be written, return False if the sample was dropped"""
+        if self._stop_event.is_set():
+            self._count_dropped(reason="writer not running")
+            return False
+
+        try:
+            self._queue.put_nowait((timestamp, long, lat, tss, draft, avg_depth))
+
+        except Full:
+            self._count_dropped(reason="writer queue is full")
+            return False
+
+        return True
+
+    def _count_dropped(self, reason: str) -> None:
+        with self._stats_lock:
+            self._dropped += 1
+            # only log when the drop cause changes, to not flood the log at the ingest rate
+            if reason != self._drop_reason:
+                self._drop_reason = reason
+                logger.warning("%s -> dropping samples" % reason)
+
+    def run(self) -> None:
+        db = None
+        try:
+            # the db connection is created (and only used) in the writer thread
+            try:
+                db = MonitorDb(projects_folder=self.projects_folder, base_name=self.base_name, wal_mode=True)
+
+            except RuntimeError as e:
+                logger.error("unable to open the writer db: %s" % e)
+                # stop accepting samples, and account for the ones already queued
+                self._stop_event.set()
+                with self._stats_lock:
+                    self._open_error = str(e)
+                    self._failed += self._discard_queued()
+                return
+
+            logger.debug("writer db: %s" % db.db_path)
+
+            while True:
+                batch = list()
+                try:
+                    batch.append(self._queue.get(timeout=self.flush_interval))
+                except Empty:
+                    if self._stop_event.is_set():
+                        break
+                    continue
+
+                # collect the samples already waiting (up to the batch size)
+                while len(batch) < self.batch_size:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except Empty:
+                        break
+
+                self._flush(db=db, batch=batch)
+
+        finally:
+            if db is not None:
+                db.close()
+            logger.debug("writer stopped: %s" % self.stats)
+
+    def _discard_queued(self) -> int:
+        nr_discarded = 0
+        while True:
+            try:
+                self._queue.get_nowait()
+            except Empty:
+                return nr_discarded
+            nr_discarded += 1
+
+    def _flush(self, db: MonitorDb, batch: list) -> None:
+        start = time.perf_counter()
+        timestamps, longs, lats, tsss, drafts, avg_depths = zip(*batch)
+        try:
+            ret = db.add_points(timestamps=timestamps, longs=longs, lats=lats, tsss=tsss, drafts=drafts,
+                                avg_depths=avg_depths)
+
+        except RuntimeError as e:
+            logger.error("unable to write %d samples: %s" % (len(batch), e))
+            ret = None
+
+        latency = time.perf_counter() - start
+
+        with self._stats_lock:
+            if ret is None:
+                self._failed += len(batch)
+            else:
+                self._written += ret[0]
+                self._skipped += ret[1]
+            self._flushes += 1
+            self._last_flush_latency = latency
+            self._max_flush_latency = max(self._max_flush_latency, latency)
+            self._total_flush_latency += latency
+
+    def stop(self, timeout: Optional[float] = 5.0) -> bool:
+        """Flush the queued samples and stop the thread, return False if not completed within the timeout"""
+        self._stop_event.set()
+        if self.is_alive():
+            self.join(timeout=timeout)
+
+        if self.is_alive():
+            logger.warning("writer not stopped after %.1f s: %d queued samples" % (timeout, self.queue_depth))
+            return False
+
+        return True
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    @property
+    def stats(self) -> dict:
+        with self._stats_lock:
+            if self._flushes > 0:
+                mean_flush_latency = self._total_flush_latency / self._flushes
+            else:
+                mean_flush_latency = 0.0
+
+            return {
+                "queue_depth": self.queue_depth,
+                "written": self._written,
+                "skipped": self._skipped,
+                "dropped": self._dropped,
+                "failed": self._failed,
+                "flushes": self._flushes,
+                "last_flush_latency": self._last_flush_latency,
+                "max_flush_latency": self._max_flush_latency,
+                "mean_flush_latency": mean_flush_latency,
+                "open_error": self._open_error,
+            }
@@ -49,17 +49,20 @@ setup(
         "setuptools",
         "wheel",
         "cython",
+        "numpy",
     ],
     install_requires=[
         "hyo2.abc2>=2.4.3",
         "hyo2.ssm2>=2025.1.6",
         "hyo2.huddl"
     ],
+    # built ahead of time (if the build fails, the pure-Python CastTime is used)
     ext_modules=cythonize([
         Extension("hyo2.sdm4.lib.estimate.casttime.casttime",
                   sources=["hyo2/sdm4/lib/estimate/casttime/casttime.pyx"],
                   include_dirs=[np.get_include()],
                   language='c++',
+                  optional=True,
                   ),
     ], annotate=True),
     python_requires='>=3.11',
@@ -0,0 +1,196 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from hyo2.sdm4.lib.casts import CastIndex, CastTracker, ProfileCache
+
+
+class FakeProfile:
+
+    def __init__(self, pk):
+        self.pk = pk
+        self.cur = SimpleNamespace(meta=SimpleNamespace(longitude=-70.0 + pk, latitude=43.0 + pk))
+
+
+class FakeSsm:
+    """Mimic the project db and the cast listing of the SSM library"""
+
+    def __init__(self, projects_folder):
+        self.projects_folder = projects_folder
+        self.current_project = "test"
+        self.rows = list()
+        self.nr_listings = 0
+        self.nr_retrievals = 0
+
+    @property
+    def db_path(self):
+        return os.path.join(self.projects_folder, self.current_project + ".db")
+
+    def add_cast(self, cast_time, pk):
+        self.rows.append((cast_time, pk))
+        self.execute("INSERT INTO casts VALUES (?, ?)", (pk, cast_time.isoformat()))
+
+    def execute(self, sql, parameters=()):
+        conn = sqlite3.connect(self.db_path)
+        with conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS casts(pk INTEGER PRIMARY KEY, time TEXT)")
+            conn.execute(sql, parameters)
+        conn.close()
+
+    def db_timestamp_list(self):
+        self.nr_listings += 1
+        return list(self.rows)
+
+    def db_retrieve_profile(self, pk):
+        self.nr_retrievals += 1
+        return FakeProfile(pk)
+
+
+class TestCastTracker(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.ssm = FakeSsm(projects_folder=self.folder)
+        self.tracker = CastTracker(ssm=self.ssm)
+        self.start = datetime(2025, 1, 1)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def test_refresh(self):
+        self.ssm.add_cast(self.start, 1)
+        self.ssm.add_cast(self.start + timedelta(hours=1), 2)
+        self.assertEqual(len(self.tracker.refresh()), 2)
+        self.assertEqual(self.tracker.last_pk, 2)
+
+        # unchanged project db -> no listing
+        for _ in range(10):
+            self.assertEqual(self.tracker.refresh(), list())
+        self.assertEqual(self.ssm.nr_listings, 1)
+
+        self.ssm.add_cast(self.start + timedelta(hours=2), 3)
+        self.assertEqual(self.tracker.refresh(), [(self.start + timedelta(hours=2), 3)])
+        self.assertEqual(self.tracker.nr_casts, 3)
+        self.assertEqual(self.tracker.stats, {"checks": 12, "refreshes": 2, "casts": 3})
+
+    def test_commit_with_same_stat(self):
+        self.ssm.add_cast(self.start, 1)
+        self.tracker.refresh()
+        stat = os.stat(self.ssm.db_path)
+
+        # a commit that changes neither the size nor the mtime of the db file
+        self.ssm.rows = [(self.start + timedelta(hours=1), 1)]
+        self.ssm.execute("UPDATE casts SET time = ? WHERE pk = 1", ((self.start + timedelta(hours=1)).isoformat(),))
+        os.utime(self.ssm.db_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        self.assertEqual(os.stat(self.ssm.db_path).st_size, stat.st_size)
+
+        self.assertEqual(self.tracker.refresh(), [(self.start + timedelta(hours=1), 1)])
+        self.assertEqual(self.ssm.nr_listings, 2)
+        self.tracker.close()
+
+    def test_missing_db(self):
+        self.ssm.rows.append((self.start, 1))
+        self.assertIsNone(self.tracker.change_token())
+        self.assertEqual(len(self.tracker.refresh()), 1)
+        self.assertEqual(self.tracker.refresh(), list())
+        self.assertEqual(self.ssm.nr_listings, 2)
+
+    def test_project_switch(self):
+        self.ssm.add_cast(self.start + timedelta(hours=1), 1)
+        self.tracker.refresh()
+        self.ssm.current_project = "other"
+        self.ssm.rows = list()
+        self.ssm.add_cast(self.start, 1)
+        self.assertEqual(self.tracker.refresh(), [(self.start, 1)])
+        self.assertEqual(self.tracker.last_time, self.start)
+
+
+class TestProfileCache(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.ssm = FakeSsm(projects_folder=self.folder)
+        self.start = datetime(2025, 1, 1)
+        for pk in range(1, 6):
+            self.ssm.add_cast(self.start + timedelta(hours=pk), pk)
+        self.cache = ProfileCache(ssm=self.ssm, tracker=CastTracker(ssm=self.ssm), max_size=3)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def test_hits(self):
+        for _ in range(10):
+            self.assertEqual(self.cache.retrieve(1).pk, 1)
+        self.assertEqual(self.ssm.nr_retrievals, 1)
+        self.assertEqual(self.cache.stats["hits"], 9)
+        self.assertEqual(self.cache.stats["misses"], 1)
+
+    def test_lru(self):
+        for pk in (1, 2, 3, 1, 4):
+            self.cache.retrieve(pk)
+        self.assertEqual(len(self.cache), 3)
+        self.assertEqual(self.cache.stats["evictions"], 1)
+        self.cache.retrieve(1)  # still cached
+        self.assertEqual(self.ssm.nr_retrievals, 4)
+        self.cache.retrieve(2)  # evicted
+        self.assertEqual(self.ssm.nr_retrievals, 5)
+
+    def test_invalidation(self):
+        self.cache.retrieve(1)
+        self.ssm.add_cast(self.start + timedelta(hours=6), 6)
+        self.cache.retrieve(1)
+        self.assertEqual(self.ssm.nr_retrievals, 2)
+        self.assertEqual(self.cache.stats["invalidations"], 1)
+
+
+class TestCastIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.ssm = FakeSsm(projects_folder=self.folder)
+        self.start = datetime(2025, 1, 1)
+        for pk in range(1, 11):
+            self.ssm.add_cast(self.start + timedelta(hours=pk), pk)
+        self.index = CastIndex(ssm=self.ssm)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def test_lonlat_between(self):
+        lons, lats = self.index.lonlat_between(self.start + timedelta(hours=3), self.start + timedelta(hours=5))
+        self.assertEqual(lons, [-67.0, -66.0, -65.0])
+        self.assertEqual(lats, [46.0, 47.0, 48.0])
+        lons, _ = self.index.lonlat_between(self.start - timedelta(days=3650), self.start + timedelta(days=3650))
+        self.assertEqual(len(lons), 10)
+        self.assertEqual(self.ssm.nr_retrievals, 10)
+        self.assertEqual(self.ssm.nr_listings, 1)
+
+    def test_incremental(self):
+        self.index.lonlat_between(self.start, self.start + timedelta(days=1))
+        self.ssm.add_cast(self.start + timedelta(minutes=30), 11)
+        lons, _ = self.index.lonlat_between(self.start, self.start + timedelta(days=1))
+        self.assertEqual(lons[0], -59.0)
+        self.assertEqual(len(self.index), 11)
+        self.assertEqual(self.ssm.nr_retrievals, 11)
+
+    def test_close(self):
+        self.index.lonlat_between(self.start, self.start + timedelta(days=1))
+        self.assertIsNotNone(self.index._tracker._version_conn)
+        self.index.close()
+        self.assertIsNone(self.index._tracker._version_conn)
+        # reopened when needed
+        self.ssm.add_cast(self.start + timedelta(hours=12), 11)
+        lons, _ = self.index.lonlat_between(self.start, self.start + timedelta(days=1))
+        self.assertEqual(len(lons), 11)
+
+
+def suite():
+    s = unittest.TestSuite()
+    s.addTests(unittest.TestLoader().loadTestsFromTestCase(TestCastTracker))
+    s.addTests(unittest.TestLoader().loadTestsFromTestCase(TestProfileCache))
+    s.addTests(unittest.TestLoader().loadTestsFromTestCase(TestCastIndex))
+    return s
@@ -0,0 +1,121 @@
+import unittest
+from datetime import datetime
+from types import SimpleNamespace
+
+import numpy as np
+
+from hyo2.sdm4.lib.estimate.casttime import CastTime, casttime_backend
+from hyo2.sdm4.lib.estimate.casttime import pycasttime
+from hyo2.sdm4.lib.estimate.casttime.pycasttime import TracedProfileCache
+
+
+class TestCastTime(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(42)
+        self.old_z = 100.0 + rng.normal(scale=0.5, size=71)
+        self.new_z = 100.0 + rng.normal(scale=0.5, size=71)
+
+    def test_backend(self):
+        self.assertIn(casttime_backend, ("cython", "python"))
+        self.assertEqual(CastTime().backend, casttime_backend)
+
+    def test_copy(self):
+        ct = CastTime()
+        ct.profiles.append("profile")
+        other = ct.copy()
+        other.profiles.append("other profile")
+        other.fixed_allowable_error = 1.0
+        self.assertEqual(len(ct.profiles), 1)
+        self.assertEqual(ct.fixed_allowable_error, 0.3)
+        self.assertEqual(ct.generation, 0)
+        self.assertEqual(other.generation, 1)
+
+    def test_ray_ends(self):
+        rays = [[np.zeros(3), np.arange(3.0) + idx, np.arange(3.0) * idx] for idx in range(5)]
+        np.testing.assert_array_equal(CastTime._ray_ends(rays, 2), [0.0, 2.0, 4.0, 6.0, 8.0])
+        np.testing.assert_array_equal(CastTime._ray_ends(rays, 1), pycasttime.CastTime._ray_ends(rays, 1))
+
+    def test_refraction(self):
+        z_diff, max_refract, rms_refract = CastTime._refraction(self.old_z, self.new_z)
+        py_z_diff, py_max_refract, py_rms_refract = pycasttime.CastTime._refraction(self.old_z, self.new_z)
+        np.testing.assert_allclose(z_diff, py_z_diff)
+        self.assertAlmostEqual(max_refract, py_max_refract)
+        self.assertAlmostEqual(rms_refract, py_rms_refract)
+        self.assertIsInstance(max_refract, np.float64)
+
+    def test_refraction_invalid(self):
+        for refraction in (CastTime._refraction, pycasttime.CastTime._refraction):
+            with self.assertRaisesRegex(RuntimeError, "different number of rays: 71, 70"):
+                refraction(self.old_z, self.new_z[:-1])
+            with self.assertRaisesRegex(RuntimeError, "no rays to compare"):
+                refraction(np.array([]), np.array([]))
+
+    def test_tolerance_counts(self):
+        z_diff = self.new_z - self.old_z
+        for tolerance in (0.1, 0.5, 1.0):
+            self.assertEqual(CastTime._tolerance_counts(z_diff, tolerance),
+                             pycasttime.CastTime._tolerance_counts(z_diff, tolerance))
+
+    def test_find_rate(self):
+        for max_refract in (0.05, 0.15, 0.25, 0.5):
+            self.assertAlmostEqual(CastTime._find_rate(max_refract, 0.3, 120.0, 60.0, 300.0, 10.0),
+                                   pycasttime.CastTime._find_rate(max_refract, 0.3, 120.0, 60.0, 300.0, 10.0))
+        # the bounds are enforced
+        self.assertEqual(CastTime._find_rate(0.01, 0.3, 1000.0, 290.0, 300.0, 10.0), 300.0)
+        self.assertEqual(CastTime._find_rate(1.0, 0.3, 1.0, 60.0, 300.0, 10.0), 10.0)
+
+
+class TestTracedProfileCache(unittest.TestCase):
+
+    def setUp(self):
+        self.nr_traced = 0
+        self.cache = TracedProfileCache(max_size=2, factory=self.trace)
+        self.ssp = SimpleNamespace(meta=SimpleNamespace(utc_time=datetime(2025, 1, 1), longitude=-70.0,
+                                                        latitude=43.0),
+                                   proc=SimpleNamespace(depth=np.arange(0.0, 100.0), speed=np.full(100, 1500.0)),
+                                   proc_valid=np.ones(100, dtype=bool))
+
+    def trace(self, **kwargs):
+        self.nr_traced += 1
+        return kwargs
+
+    def test_reuse(self):
+        profile = self.cache.retrieve(ssp=self.ssp, half_swath=70.0, avg_depth=100.0, tss_depth=5.0,
+                                      tss_value=1500.0)
+        self.assertIs(self.cache.retrieve(ssp=self.ssp, half_swath=70, avg_depth=np.float64(100.0), tss_depth=5.0,
+                                          tss_value=1500.0), profile)
+        self.assertEqual(self.nr_traced, 1)
+        self.assertEqual(self.cache.stats, {"size": 1, "hits": 1, "misses": 1})
+
+    def test_tracing_parameters(self):
+        for half_swath in (70.0, 60.0, 70.0, 50.0, 70.0):
+            self.cache.retrieve(ssp=self.ssp, half_swath=half_swath, avg_depth=100.0, tss_depth=5.0,
+                                tss_value=1500.0)
+        self.assertEqual(self.nr_traced, 3)
+        self.assertEqual(len(self.cache), 2)
+
+    def test_cast_identity(self):
+        self.cache.retrieve(ssp=self.ssp, half_swath=70.0, avg_depth=100.0, tss_depth=5.0, tss_value=1500.0, pk=1)
+        # another cast with the same time and position
+        self.cache.retrieve(ssp=self.ssp, half_swath=70.0, avg_depth=100.0, tss_depth=5.0, tss_value=1500.0, pk=2)
+        self.assertEqual(self.nr_traced, 2)
+
+        # the profile is edited
+        self.ssp.proc.speed[50] = 1490.0
+        self.cache.retrieve(ssp=self.ssp, half_swath=70.0, avg_depth=100.0, tss_depth=5.0, tss_value=1500.0, pk=1)
+        self.assertEqual(self.nr_traced, 3)
+        self.ssp.proc_valid[50] = False
+        self.cache.retrieve(ssp=self.ssp, half_swath=70.0, avg_depth=100.0, tss_depth=5.0, tss_value=1500.0, pk=1)
+        self.assertEqual(self.nr_traced, 4)
+
+    def test_shared_by_copies(self):
+        ct = CastTime()
+        self.assertIs(ct.copy().traced_profiles, ct.traced_profiles)
+
+
+def suite():
+    s = unittest.TestSuite()
+    s.addTests(unittest.TestLoader().loadTestsFromTestCase(TestCastTime))
+    s.addTests(unittest.TestLoader().loadTestsFromTestCase(TestTracedProfileCache))
+    return s
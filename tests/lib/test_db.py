@@ -0,0 +1,279 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from hyo2.sdm4.lib.db import MonitorDb
+
+
+class TestMonitorDb(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.db = MonitorDb(projects_folder=self.folder, base_name="test")
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    @staticmethod
+    def make_columns(nr_points, start=datetime(2025, 1, 1)):
+        return {
+            "timestamps": [start + timedelta(seconds=3 * idx) for idx in range(nr_points)],
+            "longs": [-70.0 + 0.001 * idx for idx in range(nr_points)],
+            "lats": [43.0 + 0.001 * idx for idx in range(nr_points)],
+            "tsss": [1500.0 + 0.1 * idx for idx in range(nr_points)],
+            "drafts": [5.0] * nr_points,
+            "avg_depths": [100.0 + idx for idx in range(nr_points)],
+        }
+
+    def test_add_points(self):
+        self.assertEqual(self.db.add_points(**self.make_columns(100)), (100, 0))
+        times, ids = self.db.timestamp_list()
+        self.assertEqual(len(times), 100)
+        self.assertEqual(len(self.db.list_points()), 100)
+
+    def test_add_points_duplicated(self):
+        self.db.add_points(**self.make_columns(50))
+        self.assertEqual(self.db.add_points(**self.make_columns(100)), (50, 50))
+        self.assertTrue(self.db.add_point(timestamp=datetime(2025, 1, 1), long=-70.0, lat=43.0, tss=1500.0,
+                                          draft=5.0, avg_depth=100.0))
+        times, _ = self.db.timestamp_list()
+        self.assertEqual(len(times), 100)
+
+    def test_add_points_invalid(self):
+        columns = self.make_columns(10)
+        columns["lats"][5] = 95.0
+        with self.assertRaises(RuntimeError):
+            self.db.add_points(**columns)
+
+        columns = self.make_columns(10)
+        columns["tsss"] = columns["tsss"][:-1]
+        with self.assertRaises(RuntimeError):
+            self.db.add_points(**columns)
+
+        times, _ = self.db.timestamp_list()
+        self.assertEqual(len(times), 0)
+
+    def test_points_between(self):
+        columns = self.make_columns(100)
+        self.db.add_points(**columns)
+
+        points = self.db.points_between()
+        self.assertEqual(set(points.keys()), set(MonitorDb.point_columns))
+        self.assertEqual(points["time"].dtype, np.dtype("datetime64[us]"))
+        self.assertEqual(len(points["tss"]), 100)
+        self.assertAlmostEqual(points["lat"][10], columns["lats"][10])
+
+        t0 = columns["timestamps"][10]
+        t1 = columns["timestamps"][19]
+        points = self.db.points_between(t0=t0, t1=t1, columns=("time", "tss"))
+        self.assertEqual(set(points.keys()), {"time", "tss"})
+        self.assertEqual(len(points["time"]), 10)
+        self.assertEqual(points["time"][0], np.datetime64(t0))
+        self.assertTrue(np.all(np.diff(points["time"]) > np.timedelta64(0)))
+
+        with self.assertRaises(RuntimeError):
+            self.db.points_between(columns=("position", ))
+
+    def test_upgrade_from_v1(self):
+        db_path = os.path.join(self.folder, "test_v1.mon")
+        conn = sqlite3.connect(db_path)
+        conn.execute("CREATE TABLE library(version int PRIMARY KEY NOT NULL DEFAULT 1, creator_info text, "
+                     "creation timestamp NOT NULL)")
+        conn.execute("INSERT INTO library VALUES (1, 'test', '2025-01-01 00:00:00')")
+        conn.execute("CREATE TABLE data(id INTEGER PRIMARY KEY, time timestamp NOT NULL, position point NOT NULL, "
+                     "tss real NOT NULL, draft real NOT NULL, avg_depth real NOT NULL)")
+        conn.execute("INSERT INTO data VALUES (NULL, '2025-01-01 00:00:03.500000', '-70.100000;43.200000', "
+                     "1500.5, 5.0, 100.0)")
+        conn.execute("INSERT INTO data VALUES (NULL, '2025-01-01 00:00:00+00:00', '-70.000000;43.100000', "
+                     "1500.0, 5.0, 101.0)")
+        # the v1 ingest could store samples with the same time
+        conn.execute("INSERT INTO data VALUES (NULL, '2025-01-01 00:00:03.500000', '-70.100000;43.200000', "
+                     "1500.5, 5.0, 100.0)")
+        conn.commit()
+        conn.close()
+
+        db = MonitorDb(projects_folder=self.folder, base_name="test_v1")
+        self.assertEqual(db.get_db_version(), MonitorDb.schema_version)
+        times, _ = db.timestamp_list()
+        self.assertEqual(times, [datetime(2025, 1, 1), datetime(2025, 1, 1, 0, 0, 3, 500000)])
+        self.assertTrue(db.has_unique_time)
+        timestamp, long, lat, tss, draft, avg_depth = db.point_by_id(1)
+        self.assertAlmostEqual(long, -70.1)
+        self.assertAlmostEqual(lat, 43.2)
+        self.assertAlmostEqual(tss, 1500.5)
+        db.close()
+
+    def make_duplicated_db(self, base_name, nr_points, start=datetime(2025, 1, 1)):
+        """Create a db storing each sample twice (as possible before the unique time index)"""
+        db = MonitorDb(projects_folder=self.folder, base_name=base_name)
+        db.add_points(**self.make_columns(nr_points, start=start))
+        db_path = db.db_path
+        db.close()
+
+        conn = sqlite3.connect(db_path)
+        conn.execute("DROP INDEX data_time_uidx")
+        conn.execute("INSERT INTO data(time, long, lat, tss, draft, avg_depth) "
+                     "SELECT time, long, lat, tss, draft, avg_depth FROM data")
+        conn.commit()
+        conn.close()
+        return db_path
+
+    def test_duplicated_times(self):
+        self.db.close()
+        self.make_duplicated_db(base_name="test", nr_points=10)
+
+        # opening never removes the stored samples
+        self.db = MonitorDb(projects_folder=self.folder, base_name="test")
+        self.assertFalse(self.db.has_unique_time)
+        times, _ = self.db.timestamp_list()
+        self.assertEqual(len(times), 20)
+
+        # the samples with a time already present are still skipped
+        self.assertEqual(self.db.add_points(**self.make_columns(15)), (5, 10))
+        self.assertTrue(self.db.add_point(timestamp=datetime(2025, 1, 1), long=-70.0, lat=43.0, tss=1500.0,
+                                          draft=5.0, avg_depth=100.0))
+        merged_path = self.make_duplicated_db(base_name="test_merge", nr_points=10,
+                                              start=datetime(2025, 1, 1, 0, 0, 30))
+        stats = self.db.merge_dbs(db_paths=[merged_path])
+        self.assertEqual((stats["inserted"], stats["skipped"]), (5, 15))
+        times, _ = self.db.timestamp_list()
+        self.assertEqual(len(times), 30)
+        self.assertEqual(len(set(times)), 20)
+
+        self.assertEqual(self.db.remove_duplicated_times(), 10)
+        self.assertTrue(self.db.has_unique_time)
+        times, _ = self.db.timestamp_list()
+        self.assertEqual(len(times), 20)
+        self.assertEqual(self.db.add_points(**self.make_columns(10)), (0, 10))
+
+    def test_merge_dbs(self):
+        self.db.add_points(**self.make_columns(50))
+
+        paths = list()
+        for idx in range(3):
+            db = MonitorDb(projects_folder=self.folder, base_name="test_merge_%d" % idx)
+            db.add_points(**self.make_columns(40, start=datetime(2025, 1, 1) + timedelta(seconds=90 * idx)))
+            paths.append(db.db_path)
+            db.close()
+        paths.append(os.path.join(self.folder, "missing.mon"))
+
+        stats = self.db.merge_dbs(db_paths=paths)
+        self.assertEqual(stats["merged_dbs"], 3)
+        self.assertEqual(stats["failed_dbs"], [paths[-1]])
+        self.assertEqual(stats["inserted"] + stats["skipped"], 120)
+        times, _ = self.db.timestamp_list()
+        self.assertEqual(len(times), stats["inserted"] + 50)
+        self.assertEqual(len(times), len(set(times)))
+
+    def test_iter_points(self):
+        columns = self.make_columns(100)
+        self.db.add_points(**columns)
+
+        batches = list(self.db.iter_points(batch_size=30))
+        self.assertEqual([len(batch["time"]) for batch in batches], [30, 30, 30, 10])
+        times = np.concatenate([batch["time"] for batch in batches])
+        self.assertTrue(np.array_equal(times, self.db.points_between()["time"]))
+
+        batches = list(self.db.iter_points(batch_size=5, t0=columns["timestamps"][10],
+                                           t1=columns["timestamps"][19], columns=("id", "tss")))
+        self.assertEqual([len(batch["tss"]) for batch in batches], [5, 5])
+        self.assertEqual(set(batches[0].keys()), {"id", "tss"})
+        self.assertEqual(int(batches[0]["id"][0]), 11)
+        self.assertAlmostEqual(batches[1]["tss"][-1], columns["tsss"][19])
+
+        extent = self.db.points_extent()
+        self.assertEqual(extent["count"], 100)
+        self.assertAlmostEqual(extent["max_lat"], columns["lats"][99])
+
+        with self.assertRaises(RuntimeError):
+            list(self.db.iter_points(columns=("position", )))
+
+    def test_iter_points_duplicated_times(self):
+        self.db.close()
+        self.make_duplicated_db(base_name="test", nr_points=5)
+        self.db = MonitorDb(projects_folder=self.folder, base_name="test")
+
+        batches = list(self.db.iter_points(batch_size=1, columns=("id", "time")))
+        self.assertEqual(len(batches), 10)
+        ids = [int(batch["id"][0]) for batch in batches]
+        self.assertEqual(sorted(ids), list(range(1, 11)))
+        times = np.concatenate([batch["time"] for batch in batches])
+        self.assertTrue(np.array_equal(times, np.sort(self.db.points_between()["time"])))
+
+        batches = list(self.db.iter_points(batch_size=1, t0=datetime(2025, 1, 1, 0, 0, 3),
+                                           t1=datetime(2025, 1, 1, 0, 0, 6)))
+        self.assertEqual(len(batches), 4)
+
+    def test_points_in_bbox(self):
+        columns = self.make_columns(100)
+        self.db.add_points(**columns)
+        self.assertTrue(self.db.has_spatial_index)
+
+        points = self.db.points_in_bbox(west=-69.9505, south=43.0, east=-69.9195, north=44.0)
+        self.assertEqual(len(points["time"]), 31)
+        self.assertTrue(np.all((points["long"] >= -69.9505) & (points["long"] <= -69.9195)))
+
+        points = self.db.points_in_bbox(west=-69.9505, south=43.0, east=-69.9195, north=44.0,
+                                        t1=columns["timestamps"][59], columns=("time", ))
+        self.assertEqual(len(points["time"]), 10)
+
+        self.db.delete_point_by_id(60)
+        points = self.db.points_in_bbox(west=-69.9505, south=43.0, east=-69.9195, north=44.0)
+        self.assertEqual(len(points["time"]), 30)
+
+        # crossing the antimeridian
+        points = self.db.points_in_bbox(west=170.0, south=43.0, east=-69.995, north=44.0)
+        self.assertEqual(len(points["time"]), 6)
+
+    def test_summaries(self):
+        columns = self.make_columns(100)
+        self.db.add_points(**columns)
+
+        summaries = self.db.summaries(resolution="minute")
+        self.assertEqual(list(summaries["count"]), [20] * 5)
+        self.assertEqual(summaries["time"][1], np.datetime64(datetime(2025, 1, 1, 0, 1)))
+        self.assertAlmostEqual(summaries["avg_depth_min"][1], 120.0)
+        self.assertAlmostEqual(summaries["avg_depth_max"][1], 139.0)
+        self.assertAlmostEqual(summaries["avg_depth_mean"][1], 129.5)
+        self.assertAlmostEqual(summaries["max_lat"][4], columns["lats"][99])
+
+        summaries = self.db.summaries(resolution="hour")
+        self.assertEqual(list(summaries["count"]), [100])
+        self.assertAlmostEqual(summaries["min_long"][0], -70.0)
+
+        # removing a sample recomputes its bucket
+        self.db.delete_point_by_id(40)
+        summaries = self.db.summaries(resolution="minute", t0=datetime(2025, 1, 1, 0, 1, 30),
+                                      t1=datetime(2025, 1, 1, 0, 2, 30))
+        self.assertEqual(list(summaries["count"]), [19, 20])
+        self.assertAlmostEqual(summaries["avg_depth_max"][0], 138.0)
+
+        # the summaries are rebuilt when missing
+        self.db.conn.execute("DROP TABLE summary_hour")
+        self.db.conn.execute("DROP TRIGGER summary_hour_insert")
+        self.db.close()
+        db = MonitorDb(projects_folder=self.folder, base_name="test")
+        self.assertEqual(list(db.summaries(resolution="hour")["count"]), [99])
+        db.close()
+
+        with self.assertRaises(RuntimeError):
+            self.db.summaries(resolution="day")
+
+    def test_wal_mode(self):
+        db = MonitorDb(projects_folder=self.folder, base_name="test_wal", wal_mode=True, check_same_thread=False)
+        self.assertEqual(db.conn.execute("PRAGMA journal_mode").fetchone()[0].lower(), "wal")
+        self.assertEqual(db.add_points(**self.make_columns(10)), (10, 0))
+        db.close()
+        self.assertIsNone(db.conn)
+
+
+def suite():
+    s = unittest.TestSuite()
+    s.addTests(unittest.TestLoader().loadTestsFromTestCase(TestMonitorDb))
+    return s
@@ -0,0 +1,90 @@
+import unittest
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from hyo2.sdm4.lib.decimate import Decimator, DeadBandDecimator, DistanceDecimator, TimeDecimator
+
+
+class TestDecimate(unittest.TestCase):
+
+    def setUp(self):
+        self.start = datetime(2025, 1, 1)
+        self.nr_samples = 100
+        self.timestamps = [self.start + timedelta(seconds=idx) for idx in range(self.nr_samples)]
+        # along a meridian, ~11.1 m each sample
+        self.longs = np.full(self.nr_samples, -70.0)
+        self.lats = 43.0 + np.arange(self.nr_samples) * 0.0001
+        self.tsss = np.full(self.nr_samples, 1500.0)
+        self.drafts = np.full(self.nr_samples, 5.0)
+        self.avg_depths = np.full(self.nr_samples, 100.0)
+
+    def _mask(self, decimator):
+        return decimator.mask(timestamps=self.timestamps, longs=self.longs, lats=self.lats, tsss=self.tsss,
+                              drafts=self.drafts, avg_depths=self.avg_depths)
+
+    def _accept(self, decimator):
+        return np.array([decimator.accept(timestamp=self.timestamps[idx], long=self.longs[idx], lat=self.lats[idx],
+                                          tss=self.tsss[idx], draft=self.drafts[idx],
+                                          avg_depth=self.avg_depths[idx])
+                         for idx in range(self.nr_samples)])
+
+    def test_time(self):
+        decimator = TimeDecimator(step=3.0)
+        keep = self._mask(decimator)
+        self.assertEqual(list(np.flatnonzero(keep)), list(range(0, self.nr_samples, 3)))
+        np.testing.assert_array_equal(self._accept(decimator), keep)
+        self.assertEqual(decimator.nr_accepted, np.count_nonzero(keep))
+        self.assertEqual(decimator.nr_rejected, self.nr_samples - np.count_nonzero(keep))
+
+    def test_distance(self):
+        decimator = DistanceDecimator(step=50.0)
+        keep = self._mask(decimator)
+        kept = np.flatnonzero(keep)
+        self.assertTrue(keep[0])
+        self.assertEqual(list(np.diff(kept)), [5] * (len(kept) - 1))
+        np.testing.assert_array_equal(self._accept(decimator), keep)
+
+    def test_dead_band(self):
+        self.tsss[40:] = 1510.0  # a TSS front
+        self.drafts[70] = 5.05  # below the threshold
+        decimator = DeadBandDecimator(tss=1.0, draft=0.1)
+        keep = self._mask(decimator)
+        self.assertEqual(list(np.flatnonzero(keep)), [0, 40])
+        np.testing.assert_array_equal(self._accept(decimator), keep)
+
+        decimator = DeadBandDecimator(tss=1.0, max_interval=30.0)
+        self.assertEqual(list(np.flatnonzero(self._mask(decimator))), [0, 30, 40, 70])
+
+    def test_mask_is_stateless(self):
+        decimator = TimeDecimator(step=10.0)
+        decimator.accept(timestamp=self.timestamps[-1], long=-70.0, lat=43.0, tss=1500.0, draft=5.0,
+                         avg_depth=100.0)
+        self.assertTrue(self._mask(decimator)[0])
+        self.assertEqual(decimator.nr_accepted, 1)
+
+    def test_invalid(self):
+        with self.assertRaises(RuntimeError):
+            TimeDecimator(step=0.0)
+        with self.assertRaises(RuntimeError):
+            DistanceDecimator(step=-1.0)
+        with self.assertRaises(RuntimeError):
+            DeadBandDecimator()
+        with self.assertRaises(RuntimeError):
+            TimeDecimator(step=1.0).mask(timestamps=self.timestamps, longs=self.longs[:10], lats=self.lats,
+                                         tsss=self.tsss, drafts=self.drafts, avg_depths=self.avg_depths)
+
+    def test_abstract(self):
+        class NoPolicy(Decimator):
+            pass
+
+        with self.assertRaises(TypeError):
+            Decimator()
+        with self.assertRaises(TypeError):
+            NoPolicy()
+
+
+def suite():
+    s = unittest.TestSuite()
+    s.addTests(unittest.TestLoader().loadTestsFromTestCase(TestDecimate))
+    return s
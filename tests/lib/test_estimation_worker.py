@@ -0,0 +1,45 @@
+import unittest
+from threading import Event
+
+from hyo2.sdm4.lib.estimate.worker import EstimationWorker
+
+
+class TestEstimationWorker(unittest.TestCase):
+
+    def setUp(self):
+        self.worker = EstimationWorker(name="TestEstimationWorker")
+
+    def tearDown(self):
+        self.worker.shutdown()
+
+    def test_submit(self):
+        future = self.worker.submit(lambda a, b: a + b, 1, b=2)
+        self.assertEqual(future.result(timeout=5.0), 3)
+        self.assertFalse(self.worker.busy)
+        stats = self.worker.stats
+        self.assertEqual(stats["submitted"], 1)
+        self.assertEqual(stats["completed"], 1)
+
+    def test_busy(self):
+        release = Event()
+        future = self.worker.submit(release.wait, 5.0)
+        self.assertTrue(self.worker.busy)
+        self.assertIsNone(self.worker.submit(lambda: None))
+        release.set()
+        self.assertTrue(future.result(timeout=5.0))
+        self.assertIsNotNone(self.worker.submit(lambda: None))
+
+    def test_failure(self):
+        def job():
+            raise RuntimeError("test")
+
+        future = self.worker.submit(job)
+        with self.assertRaises(RuntimeError):
+            future.result(timeout=5.0)
+        self.assertEqual(self.worker.stats["failed"], 1)
+
+
+def suite():
+    s = unittest.TestSuite()
+    s.addTests(unittest.TestLoader().loadTestsFromTestCase(TestEstimationWorker))
+    return s
@@ -0,0 +1,102 @@
+import unittest
+from datetime import datetime, timedelta
+
+from hyo2.sdm4.lib.ingest import SisIngest, read_sis_sample
+
+
+class FakeXyz:
+
+    def __init__(self, dg_time):
+        self.dg_time = dg_time
+
+
+class FakeSisListener:
+    """Mimic the attributes of the SIS listener used by the ingest"""
+
+    def __init__(self):
+        self.nav = None
+        self.nav_timestamp = None
+        self.nav_latitude = None
+        self.nav_longitude = None
+        self.xyz = None
+        self.xyz_transducer_sound_speed = None
+        self.xyz_transducer_depth = None
+        self.xyz_mean_depth = None
+        self.nr_parsed = 0
+
+    def parse(self, dg_time):
+        self.nr_parsed += 1
+        self.nav = True
+        self.nav_timestamp = dg_time
+        self.nav_latitude = 43.0
+        self.nav_longitude = -70.0
+        self.xyz = FakeXyz(dg_time)
+        self.xyz_transducer_sound_speed = 1500.0
+        self.xyz_transducer_depth = 5.0
+        self.xyz_mean_depth = 100.0
+
+
+class TestSisIngest(unittest.TestCase):
+
+    def setUp(self):
+        self.samples = list()
+        self.ingest = SisIngest(callback=lambda *sample: self.samples.append(sample))
+        self.listener = FakeSisListener()
+        self.start = datetime(2025, 1, 1)
+
+    def test_read_sis_sample(self):
+        self.assertIsNone(read_sis_sample(self.listener))
+        self.listener.parse(self.start)
+        self.assertEqual(read_sis_sample(self.listener), (self.start, 43.0, -70.0, 1500.0, 5.0, 100.0))
+
+    def test_every_datagram(self):
+        self.ingest.attach(self.listener)
+        self.assertIs(self.ingest.listener, self.listener)
+        for idx in range(10):
+            self.listener.parse(self.start + timedelta(seconds=0.1 * idx))
+        self.assertEqual(self.listener.nr_parsed, 10)
+        self.assertEqual(len(self.samples), 10)
+        self.assertEqual(self.samples[-1][0], self.start + timedelta(seconds=0.9))
+
+        # an older datagram is skipped
+        self.listener.parse(self.start)
+        self.assertEqual(len(self.samples), 10)
+        self.assertEqual(self.ingest.stats, {"received": 10, "skipped": 1, "errors": 0})
+
+    def test_callback_error(self):
+        def callback(*_):
+            raise RuntimeError("test")
+
+        ingest = SisIngest(callback=callback)
+        ingest.attach(self.listener)
+        self.listener.parse(self.start)
+        self.assertEqual(ingest.stats["errors"], 1)
+        ingest.detach()
+
+    def test_detach(self):
+        self.ingest.attach(self.listener)
+        self.ingest.detach()
+        self.assertIsNone(self.ingest.listener)
+        self.assertNotIn("parse", vars(self.listener))
+        self.listener.parse(self.start)
+        self.assertEqual(len(self.samples), 0)
+        self.assertEqual(self.listener.nr_parsed, 1)
+
+    def test_unusable_listener(self):
+        class SlotsListener:
+            __slots__ = ("xyz",)
+
+            def parse(self):
+                pass
+
+        self.assertFalse(self.ingest.attach(object()))
+        self.assertFalse(self.ingest.attach(SlotsListener()))
+        self.assertIsNone(self.ingest.listener)
+        self.assertTrue(self.ingest.attach(self.listener))
+        self.assertTrue(self.ingest.attach(self.listener))
+
+
+def suite():
+    s = unittest.TestSuite()
+    s.addTests(unittest.TestLoader().loadTestsFromTestCase(TestSisIngest))
+    return s
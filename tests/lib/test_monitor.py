@@ -1,9 +1,63 @@
+import shutil
+import tempfile
 import unittest
+from concurrent.futures import wait
+from datetime import datetime, timedelta
+from threading import Event, Thread
+from types import SimpleNamespace
 
+from hyo2.sdm4.lib.db import MonitorDb
+from hyo2.sdm4.lib.ingest import IngestMode
 from hyo2.sdm4.lib.monitor import SurveyDataMonitor
 from hyo2.ssm2.lib.soundspeed import SoundSpeedLibrary
 
 
+class FakeSsm:
+    """Mimic the parts of the SSM library used by the monitor"""
+
+    def __init__(self, folder, sis=None):
+        self.data_folder = folder
+        self.projects_folder = folder
+        self.current_project = "test"
+        self.listeners = SimpleNamespace(sis=sis)
+        self.rows = list()
+        self.missing_pks = set()
+
+    def db_timestamp_list(self):
+        return list(self.rows)
+
+    def db_retrieve_profile(self, pk):
+        if pk in self.missing_pks:
+            return None
+        return SimpleNamespace(pk=pk, cur=SimpleNamespace(interpolate_proc_speed_at_depth=lambda depth: 1500.0))
+
+
+class StubCastTime:
+    """Record the estimated casts (optionally failing, or waiting for a gate to be opened)"""
+
+    def __init__(self, fail=False, gate=None):
+        self.generation = 0
+        self.fail = fail
+        self.gate = gate
+        self.casts = list()
+        self.next_loc_cast_time = None
+
+    def copy(self):
+        other = StubCastTime(fail=self.fail, gate=self.gate)
+        other.generation = self.generation
+        other.casts = list(self.casts)
+        return other
+
+    def update(self, tss_depth, tss_value, avg_depth, latest_cast_time, latest_ssp, latest_pk=None):
+        if self.gate is not None:
+            self.gate.wait(timeout=5.0)
+        if self.fail:
+            raise RuntimeError("failing estimation")
+        self.casts.append(latest_pk)
+        self.next_loc_cast_time = latest_cast_time + timedelta(hours=1)
+        return True
+
+
 class TestSurveyDataMonitor(unittest.TestCase):
 
     def test_init(self):
@@ -11,7 +65,188 @@ class TestSurveyDataMonitor(unittest.TestCase):
         sdm = SurveyDataMonitor(ssm=ssm)
 
 
+class TestSisIngestMode(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def test_polling_fallback(self):
+        sdm = SurveyDataMonitor(ssm=FakeSsm(self.folder, sis=object()))
+        sdm.ingest_mode = IngestMode.CALLBACK
+        with self.assertLogs("hyo2.sdm4.lib.monitor", level="WARNING"):
+            sdm._update_sis_ingest()
+        self.assertEqual(sdm.ingest_mode, IngestMode.POLLING)
+
+    def test_callback_counter(self):
+        sdm = SurveyDataMonitor(ssm=FakeSsm(self.folder))
+        # the listener thread counts the samples while the GUI holds the data lock
+        sdm.lock_data()
+        try:
+            listener = Thread(target=sdm._count_sis_sample)
+            listener.start()
+            listener.join(timeout=5.0)
+            self.assertFalse(listener.is_alive())
+            self.assertEqual(sdm._counter, 1)
+            self.assertTrue(sdm._has_sis_data)
+        finally:
+            sdm.unlock_data()
+
+
+class TestCastTimeEstimation(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.ssm = FakeSsm(self.folder)
+        self.start = datetime(2025, 1, 1)
+        self.ssm.rows = [(self.start, 1), (self.start + timedelta(hours=1), 2)]
+        self.sdm = SurveyDataMonitor(ssm=self.ssm)
+        self.sdm._cast_time = StubCastTime()
+
+    def tearDown(self):
+        self.sdm.stop_monitor()
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def step(self):
+        """Run an estimation step, waiting for the submitted job to complete"""
+        self.sdm._estimate_with_cast_time()
+        if self.sdm._estimation is not None:
+            wait([self.sdm._estimation], timeout=5.0)
+
+    def test_publish(self):
+        self.step()
+        self.assertEqual(self.sdm._pending_casts, self.ssm.rows)
+        self.step()
+        self.assertEqual(self.sdm._cast_time.casts, [1, 2])
+        self.assertEqual(self.sdm._pending_casts, list())
+        self.assertEqual(self.sdm.current_time, self.start + timedelta(hours=1))
+        self.assertEqual(self.sdm._next_cast_time, self.start + timedelta(hours=2))
+
+        # a new cast
+        self.ssm.rows.append((self.start + timedelta(hours=2), 3))
+        self.step()
+        self.step()
+        self.assertEqual(self.sdm._cast_time.casts, [1, 2, 3])
+        self.assertEqual(self.sdm.estimation_stats["completed"], 2)
+
+    def test_generation_conflict(self):
+        gate = Event()
+        self.sdm._cast_time = StubCastTime(gate=gate)
+        self.sdm._estimate_with_cast_time()
+        # the estimator settings change during the estimation
+        self.sdm._cast_time.generation += 1
+        gate.set()
+        wait([self.sdm._estimation], timeout=5.0)
+
+        # the result is discarded, and the casts estimated again with the current estimator
+        self.step()
+        self.assertEqual(self.sdm._cast_time.casts, list())
+        self.assertEqual(self.sdm._pending_casts, self.ssm.rows)
+        self.step()
+        self.assertEqual(self.sdm._cast_time.casts, [1, 2])
+        self.assertEqual(self.sdm._cast_time.generation, 1)
+        self.assertEqual(self.sdm._pending_casts, list())
+
+    def test_missing_profile(self):
+        self.ssm.missing_pks.add(1)
+        with self.assertLogs("hyo2.sdm4.lib.monitor", level="WARNING"):
+            self.step()
+            self.step()
+        self.assertEqual(self.sdm._cast_time.casts, [2])
+        self.assertEqual(self.sdm._pending_casts, list())
+
+        self.ssm.missing_pks.add(3)
+        self.ssm.rows.append((self.start + timedelta(hours=2), 3))
+        with self.assertLogs("hyo2.sdm4.lib.monitor", level="WARNING"):
+            self.step()
+            self.step()
+        self.assertEqual(self.sdm._cast_time.casts, [2])
+        self.assertEqual(self.sdm.current_time, self.start + timedelta(hours=1))
+        self.assertEqual(self.sdm._pending_casts, list())
+
+    def test_failure(self):
+        self.sdm._cast_time = StubCastTime(fail=True)
+        with self.assertLogs("hyo2.sdm4.lib.monitor", level="ERROR"):
+            self.step()
+            self.step()
+        # the pending casts are kept for the next attempt
+        self.assertEqual(self.sdm._pending_casts, self.ssm.rows)
+        self.assertEqual(self.sdm._estimation_failures, 1)
+
+        with self.assertLogs("hyo2.sdm4.lib.monitor", level="ERROR"):
+            self.step()
+            self.step()
+        # too many failures -> the oldest cast is dropped
+        self.assertEqual(self.sdm._pending_casts, self.ssm.rows[1:])
+
+        self.sdm._cast_time.fail = False
+        self.step()
+        self.step()
+        self.assertEqual(self.sdm._cast_time.casts, [2])
+        self.assertEqual(self.sdm._pending_casts, list())
+
+    def test_discard_on_stop(self):
+        gate = Event()
+        self.sdm._cast_time = StubCastTime(gate=gate)
+        self.sdm._estimate_with_cast_time()
+        estimation = self.sdm._estimation
+        self.sdm.stop_monitor()
+        gate.set()
+        wait([estimation], timeout=5.0)
+
+        # the result of the running job is never published, and its casts are still pending
+        self.assertIsNone(self.sdm._estimation)
+        self.assertEqual(self.sdm._cast_time.casts, list())
+        self.assertEqual(self.sdm._pending_casts, self.ssm.rows)
+
+
+class TestAddDbData(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.sdm = SurveyDataMonitor(ssm=FakeSsm(self.folder))
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def test_streamed_read_back(self):
+        nr_points = 100
+        start = datetime(2025, 1, 1)
+        db = MonitorDb(projects_folder=self.folder, base_name="session")
+        db.add_points(timestamps=[start + timedelta(seconds=3 * idx) for idx in range(nr_points)],
+                      longs=[-70.0] * nr_points, lats=[43.0] * nr_points,
+                      tsss=[1500.0 + idx for idx in range(nr_points)], drafts=[5.0] * nr_points,
+                      avg_depths=[100.0] * nr_points)
+        db_path = db.db_path
+        db.close()
+
+        self.sdm.retention_samples = 20
+        self.sdm._read_back_batch_size = 15
+        batch_sizes = list()
+        merge = self.sdm._samples.merge
+
+        def recording_merge(**kwargs):
+            batch_sizes.append(len(kwargs["timestamps"]))
+            return merge(**kwargs)
+
+        self.sdm._samples.merge = recording_merge
+        self.sdm.add_db_data([db_path])
+
+        # the session is never loaded as a whole
+        self.assertEqual(sum(batch_sizes), nr_points)
+        self.assertLessEqual(max(batch_sizes), 15)
+        snapshot = self.sdm.snapshot()
+        self.assertEqual(len(snapshot), 20)
+        self.assertEqual(snapshot.nr_discarded, 80)
+        self.assertEqual(snapshot.latest("tss"), 1599.0)
+
+
 def suite():
     s = unittest.TestSuite()
     s.addTests(unittest.TestLoader().loadTestsFromTestCase(TestSurveyDataMonitor))
+    s.addTests(unittest.TestLoader().loadTestsFromTestCase(TestSisIngestMode))
+    s.addTests(unittest.TestLoader().loadTestsFromTestCase(TestCastTimeEstimation))
+    s.addTests(unittest.TestLoader().loadTestsFromTestCase(TestAddDbData))
     return s
@@ -0,0 +1,169 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from hyo2.sdm4.lib.samples import SampleStore
+
+
+class TestSampleStore(unittest.TestCase):
+
+    @staticmethod
+    def fill(store, nr_samples, start=datetime(2025, 1, 1)):
+        for idx in range(nr_samples):
+            store.append(timestamp=start + timedelta(seconds=idx), long=-70.0 + 0.001 * idx,
+                         lat=43.0 + 0.001 * idx, tss=1500.0 + idx, draft=5.0, avg_depth=100.0)
+
+    def test_append(self):
+        store = SampleStore(initial_capacity=4)
+        self.fill(store, 100)
+        self.assertEqual(len(store), 100)
+        self.assertGreaterEqual(store.capacity, 100)
+        self.assertEqual(store.column("time").dtype, np.dtype("datetime64[us]"))
+        self.assertEqual(store.column("time")[10], np.datetime64(datetime(2025, 1, 1, 0, 0, 10)))
+        self.assertEqual(store.latest("tss"), 1599.0)
+
+        # aware timestamps are stored as UTC
+        store.append(timestamp=datetime(2025, 1, 1, 3, tzinfo=timezone(timedelta(hours=2))), long=0.0, lat=0.0,
+                     tss=1500.0, draft=5.0, avg_depth=100.0)
+        self.assertEqual(store.latest("time"), np.datetime64(datetime(2025, 1, 1, 1)))
+
+        store.clear()
+        self.assertEqual(len(store), 0)
+        self.assertIsNone(store.latest("tss"))
+
+    def test_read_only_views(self):
+        store = SampleStore()
+        self.fill(store, 10)
+        tsss = store.column("tss")
+        with self.assertRaises(ValueError):
+            tsss[0] = 0.0
+        with self.assertRaises(RuntimeError):
+            store.column("position")
+
+    def test_snapshot(self):
+        store = SampleStore(initial_capacity=4, max_size=20)
+        self.fill(store, 10)
+        snapshot = store.snapshot()
+        tsss = snapshot.column("tss").copy()
+
+        # the snapshot is not affected by the following changes (growth, retention, merge, clear)
+        self.fill(store, 30, start=datetime(2025, 1, 2))
+        store.insert(0, timestamp=datetime(2024, 1, 1), long=0.0, lat=0.0, tss=0.0, draft=0.0, avg_depth=0.0)
+        store.clear()
+        self.assertEqual(len(snapshot), 10)
+        self.assertTrue(np.array_equal(snapshot.column("tss"), tsss))
+        self.assertGreater(store.version, snapshot.version)
+        with self.assertRaises(ValueError):
+            snapshot.column("tss")[0] = 0.0
+
+    def test_samples_since(self):
+        store = SampleStore(max_size=15)
+        self.fill(store, 10)
+        delta = store.snapshot().samples_since(seq=0)
+        self.assertEqual(len(delta["samples"]["time"]), 10)
+        self.assertFalse(delta["reset"] or delta["gap"])
+        seq = delta["seq"]
+        generation = delta["generation"]
+        self.assertEqual(store.snapshot().samples_since(seq=seq, generation=generation)["samples"]["tss"].size, 0)
+
+        # an older sample merged in the middle is still reported as new
+        store.merge(timestamps=[datetime(2024, 12, 31)], longs=[0.0], lats=[0.0], tsss=[1.0], drafts=[0.0],
+                    avg_depths=[0.0])
+        self.fill(store, 2, start=datetime(2025, 1, 2))
+        delta = store.snapshot().samples_since(seq=seq, generation=generation)
+        self.assertEqual(list(delta["samples"]["tss"]), [1.0, 1500.0, 1501.0])
+        self.assertFalse(delta["gap"])
+        seq = delta["seq"]
+
+        # samples discarded by the retention before being retrieved
+        self.fill(store, 20, start=datetime(2025, 1, 3))
+        delta = store.snapshot().samples_since(seq=seq, generation=generation)
+        self.assertTrue(delta["gap"])
+        self.assertEqual(len(delta["samples"]["time"]), 15)
+
+        # clear
+        store.clear()
+        self.fill(store, 3)
+        delta = store.snapshot().samples_since(seq=delta["seq"], generation=generation)
+        self.assertTrue(delta["reset"])
+        self.assertFalse(delta["gap"])
+        self.assertEqual(len(delta["samples"]["time"]), 3)
+        self.assertEqual(delta["generation"], generation + 1)
+
+    def test_insert(self):
+        store = SampleStore(initial_capacity=2)
+        self.fill(store, 10)
+        timestamp = datetime(2025, 1, 1, 0, 0, 4, 500000)
+        self.assertFalse(store.contains(timestamp))
+        idx = store.searchsorted(timestamp)
+        self.assertEqual(idx, 5)
+        store.insert(idx, timestamp=timestamp, long=0.0, lat=0.0, tss=1.0, draft=2.0, avg_depth=3.0)
+        self.assertTrue(store.contains(timestamp))
+        self.assertEqual(len(store), 11)
+        self.assertTrue(np.all(np.diff(store.column("time")) > np.timedelta64(0)))
+        self.assertEqual(store.column("tss")[5], 1.0)
+        self.assertEqual(store.column("tss")[6], 1505.0)
+
+        with self.assertRaises(RuntimeError):
+            store.insert(20, timestamp=timestamp, long=0.0, lat=0.0, tss=1.0, draft=2.0, avg_depth=3.0)
+
+    def test_merge(self):
+        store = SampleStore(initial_capacity=4)
+        self.fill(store, 10)
+
+        # unordered batch, with repeated times and times already in the store
+        start = datetime(2025, 1, 1)
+        offsets = [20.0, 4.5, 3.0, 12.0, 4.5, -1.0, 9.0, 11.0]
+        timestamps = [start + timedelta(seconds=offset) for offset in offsets]
+        nr_merged = store.merge(timestamps=timestamps, longs=offsets, lats=offsets, tsss=offsets,
+                                drafts=offsets, avg_depths=offsets)
+        self.assertEqual(nr_merged, 5)
+        self.assertEqual(len(store), 15)
+        self.assertTrue(np.all(np.diff(store.column("time")) > np.timedelta64(0)))
+        self.assertEqual(list(store.column("tss")[:7]), [-1.0, 1500.0, 1501.0, 1502.0, 1503.0, 1504.0, 4.5])
+        self.assertEqual(list(store.column("tss")[-3:]), [11.0, 12.0, 20.0])
+
+        # newer batch as datetime64 array
+        times = np.array([np.datetime64(start + timedelta(seconds=30 + idx)) for idx in range(5)])
+        self.assertEqual(store.merge(timestamps=times, longs=np.zeros(5), lats=np.zeros(5), tsss=np.arange(5),
+                                     drafts=np.zeros(5), avg_depths=np.zeros(5)), 5)
+        self.assertEqual(store.latest("tss"), 4.0)
+        self.assertEqual(store.merge(timestamps=times, longs=np.zeros(5), lats=np.zeros(5), tsss=np.arange(5),
+                                     drafts=np.zeros(5), avg_depths=np.zeros(5)), 0)
+
+        with self.assertRaises(RuntimeError):
+            store.merge(timestamps=times, longs=np.zeros(4), lats=np.zeros(5), tsss=np.zeros(5),
+                        drafts=np.zeros(5), avg_depths=np.zeros(5))
+
+    def test_max_size(self):
+        store = SampleStore(initial_capacity=4, max_size=10)
+        self.fill(store, 1000)
+        self.assertEqual(len(store), 10)
+        self.assertLessEqual(store.capacity, 32)
+        self.assertEqual(store.column("time")[0], np.datetime64(datetime(2025, 1, 1, 0, 16, 30)))
+        self.assertEqual(store.latest("tss"), 2499.0)
+
+        store.max_size = 5
+        self.assertEqual(len(store), 5)
+        self.assertEqual(store.column("tss")[0], 2495.0)
+
+    def test_max_span(self):
+        store = SampleStore(max_span=timedelta(seconds=60))
+        self.fill(store, 100)
+        self.assertEqual(len(store), 61)
+        self.assertEqual(store.nr_discarded, 39)
+        self.assertEqual(store.column("time")[0], np.datetime64(datetime(2025, 1, 1, 0, 0, 39)))
+
+        store.max_span = timedelta(seconds=10)
+        self.assertEqual(len(store), 11)
+        self.assertEqual(store.nr_discarded, 89)
+
+        store.clear()
+        self.assertEqual(store.nr_discarded, 0)
+
+
+def suite():
+    s = unittest.TestSuite()
+    s.addTests(unittest.TestLoader().loadTestsFromTestCase(TestSampleStore))
+    return s
@@ -0,0 +1,114 @@
+import unittest
+from threading import Event
+
+from hyo2.sdm4.lib.scheduler import FixedRateScheduler
+
+
+class FakeClock:
+    """Simulated time: it only advances when the scheduler waits or when a task consumes it"""
+
+    def __init__(self):
+        self.now = 0.0
+        self.nr_waits = 0
+        self.actions = dict()  # wait number: callable run at that wait
+
+    def __call__(self):
+        return self.now
+
+    def wait(self, timeout):
+        self.nr_waits += 1
+        self.now += timeout
+        action = self.actions.get(self.nr_waits)
+        if action is not None:
+            action()
+
+
+class TestFixedRateScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.runs = list()
+        self.done = Event()
+
+    def make_scheduler(self, task, period=0.02):
+        return FixedRateScheduler(task=task, period=period, clock=self.clock, wait=self.clock.wait)
+
+    def run_scheduler(self, scheduler):
+        """Run until the scheduler stops itself (in simulated time, the test thread does not interfere)"""
+        scheduler.start()
+        self.assertTrue(self.done.wait(timeout=5.0))
+        self.assertTrue(scheduler.stop(timeout=5.0))
+        self.assertFalse(scheduler.running)
+
+    def stop_scheduler(self, scheduler):
+        scheduler.stop()
+        self.done.set()
+
+    def test_fixed_rate(self):
+        def task():
+            self.runs.append(self.clock.now)
+            self.clock.now += 0.005  # task duration
+            if len(self.runs) == 10:
+                self.stop_scheduler(scheduler)
+
+        scheduler = self.make_scheduler(task)
+        self.run_scheduler(scheduler)
+
+        # no drift: the runs stay on the initial phase
+        for idx, run in enumerate(self.runs):
+            self.assertAlmostEqual(run, 0.02 * idx)
+        stats = scheduler.stats
+        self.assertEqual(stats["runs"], 10)
+        self.assertEqual(stats["overruns"], 0)
+        self.assertEqual(stats["errors"], 0)
+        self.assertAlmostEqual(stats["max_duration"], 0.005)
+
+    def test_errors_and_overruns(self):
+        def task():
+            self.runs.append(self.clock.now)
+            if len(self.runs) == 1:
+                raise RuntimeError("failing task")
+            if len(self.runs) == 2:
+                self.clock.now += 0.05  # longer than two periods
+            if len(self.runs) == 4:
+                self.stop_scheduler(scheduler)
+
+        scheduler = self.make_scheduler(task)
+        self.run_scheduler(scheduler)
+
+        # the missed ticks are skipped, keeping the phase
+        for run, expected in zip(self.runs, (0.0, 0.02, 0.08, 0.10)):
+            self.assertAlmostEqual(run, expected)
+        stats = scheduler.stats
+        self.assertEqual(stats["runs"], 4)
+        self.assertEqual(stats["errors"], 1)
+        self.assertEqual(stats["overruns"], 1)
+        self.assertEqual(stats["skipped_ticks"], 2)
+
+    def test_pause(self):
+        scheduler = self.make_scheduler(lambda: self.runs.append(self.clock.now))
+        self.clock.actions = {2: scheduler.pause, 5: scheduler.resume, 7: lambda: self.stop_scheduler(scheduler)}
+        self.run_scheduler(scheduler)
+
+        stats = scheduler.stats
+        self.assertEqual(stats["ticks"], 7)
+        self.assertEqual(stats["runs"], 4)
+        self.assertAlmostEqual(self.runs[2], 0.1)
+
+        with self.assertRaises(RuntimeError):
+            FixedRateScheduler(task=lambda: None, period=0.0)
+
+    def test_monotonic_clock(self):
+        has_run = Event()
+        scheduler = FixedRateScheduler(task=has_run.set, period=0.01)
+        scheduler.start()
+        self.assertTrue(has_run.wait(timeout=5.0))
+        self.assertTrue(scheduler.stop(timeout=5.0))
+        self.assertFalse(scheduler.running)
+        self.assertGreaterEqual(scheduler.stats["runs"], 1)
+
+
+def suite():
+    s = unittest.TestSuite()
+    s.addTests(unittest.TestLoader().loadTestsFromTestCase(TestFixedRateScheduler))
+    return s
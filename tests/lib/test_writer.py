@@ -0,0 +1,85 @@
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+from hyo2.sdm4.lib.db import MonitorDb
+from hyo2.sdm4.lib.writer import DbWriter
+
+
+class TestDbWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    @staticmethod
+    def put_samples(writer, nr_samples):
+        start = datetime(2025, 1, 1)
+        return [writer.put(timestamp=start + timedelta(seconds=idx), long=-70.0, lat=43.0, tss=1500.0, draft=5.0,
+                           avg_depth=100.0) for idx in range(nr_samples)]
+
+    def test_write(self):
+        writer = DbWriter(projects_folder=self.folder, base_name="test", batch_size=7, flush_interval=0.05)
+        writer.start()
+        self.assertTrue(all(self.put_samples(writer, 50)))
+        self.assertTrue(writer.stop(timeout=5.0))
+
+        stats = writer.stats
+        self.assertEqual(stats["written"], 50)
+        self.assertEqual(stats["dropped"], 0)
+        self.assertEqual(stats["queue_depth"], 0)
+        self.assertGreater(stats["flushes"], 0)
+
+        db = MonitorDb(projects_folder=self.folder, base_name="test")
+        times, _ = db.timestamp_list()
+        self.assertEqual(len(times), 50)
+        db.close()
+
+        # samples are not accepted after stop
+        self.assertFalse(any(self.put_samples(writer, 1)))
+
+    def test_full_queue(self):
+        writer = DbWriter(projects_folder=self.folder, base_name="test", max_queue_size=10, flush_interval=0.05)
+        self.assertEqual(sum(self.put_samples(writer, 15)), 10)
+        self.assertEqual(writer.stats["dropped"], 5)
+
+        writer.start()
+        self.assertTrue(writer.stop(timeout=5.0))
+        self.assertEqual(writer.stats["written"], 10)
+
+    def test_not_running(self):
+        writer = DbWriter(projects_folder=self.folder, base_name="test", flush_interval=0.05)
+        writer.start()
+        self.assertTrue(writer.stop(timeout=5.0))
+        with self.assertLogs("hyo2.sdm4.lib.writer", level="WARNING") as logs:
+            self.assertFalse(any(self.put_samples(writer, 3)))
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn("writer not running", logs.output[0])
+        self.assertEqual(writer.stats["dropped"], 3)
+
+    def test_open_failure(self):
+        writer = DbWriter(projects_folder=os.path.join(self.folder, "missing"), base_name="test",
+                          flush_interval=0.05)
+        self.assertTrue(all(self.put_samples(writer, 5)))
+        with self.assertLogs("hyo2.sdm4.lib.writer", level="ERROR"):
+            writer.start()
+            writer.join(timeout=5.0)
+        self.assertFalse(writer.is_alive())
+        self.assertTrue(writer.stop(timeout=5.0))
+
+        stats = writer.stats
+        self.assertIsNotNone(stats["open_error"])
+        self.assertEqual(stats["failed"], 5)
+        self.assertEqual(stats["queue_depth"], 0)
+        self.assertFalse(any(self.put_samples(writer, 1)))
+        self.assertEqual(writer.stats["dropped"], 1)
+
+
+def suite():
+    s = unittest.TestSuite()
+    s.addTests(unittest.TestLoader().loadTestsFromTestCase(TestDbWriter))
+    return s